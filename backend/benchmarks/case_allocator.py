@@ -0,0 +1,81 @@
+"""Concurrency check for case-number allocation: N parallel "new case" calls must
+all get distinct, gap-free ids. Also runs the old load-and-max() allocator for comparison.
+First it empties the cases and counters and checks that a fresh install, where the
+viewer captures into the get-latest-case fallback id, doesn't get that id again from
+"new case".
+
+Use a throwaway database migrated to head, it is wiped and today's counter advanced:
+    export BENCH_DATABASE_URL=postgresql+asyncpg://user:pw@localhost/pathology_bench
+    python -m benchmarks.case_allocator 500
+"""
+import asyncio
+import os
+import sys
+import time
+from datetime import date
+
+BENCH_URL = os.getenv("BENCH_DATABASE_URL")
+if BENCH_URL:
+    os.environ["ASYNC_DATABASE_URL"] = BENCH_URL   # db.session builds its engine at import
+
+from sqlalchemy import select, delete
+import functions
+from db.models import Case, CaseCounter
+from db.session import AsyncSessionMaker, engine
+
+
+async def old_allocator(session):
+    today = date.today().isoformat()
+    cases = (await session.scalars(select(Case).where(Case.case_id.like(f"{today}--%")))).all()
+    if cases:
+        return f"{today}--{str(max(int(c.case_id.split('--')[-1]) for c in cases) + 1).zfill(2)}"
+    return f"{today}--01"
+
+
+async def allocate(allocator):
+    async with AsyncSessionMaker() as session:
+        return await allocator(session)
+
+
+async def run(name, allocator, n):
+    start = time.perf_counter()
+    ids = await asyncio.gather(*[allocate(allocator) for _ in range(n)])
+    elapsed = time.perf_counter() - start
+    numbers = sorted(int(i.split("--")[-1]) for i in ids)
+    duplicates = n - len(set(ids))
+    gaps = numbers[-1] - numbers[0] + 1 - len(set(numbers))
+    print(f"{name:<8} {n} allocations in {elapsed * 1000:.0f} ms: "
+          f"{duplicates} duplicates, {gaps} gaps, range {numbers[0]}..{numbers[-1]}")
+    return duplicates == 0 and gaps == 0
+
+
+async def fresh_install():
+    """Empty db: capture into the fallback latest case, then ask for a new one."""
+    async with AsyncSessionMaker() as session:
+        await session.execute(delete(Case))
+        await session.execute(delete(CaseCounter))
+        await session.commit()
+        await functions.save_user_settings("bench", {}, session)
+        latest = await functions.find_latest_case(session)
+        await functions.check_create_case(latest, "bench", session)
+        new = await functions.create_new_case_number(session)
+    print(f"fresh    latest {latest}, new case {new}")
+    return new != latest
+
+
+async def main(n=300):
+    if not BENCH_URL:
+        raise SystemExit("set BENCH_DATABASE_URL to a throwaway database")
+    try:
+        if not await fresh_install():
+            raise SystemExit("new case reused the id the viewer was already capturing into")
+        await run("old", old_allocator, n)
+        ok = await run("counter", functions.create_new_case_number, n)
+    finally:
+        await engine.dispose()
+    if not ok:
+        raise SystemExit("counter allocator handed out duplicate or skipped ids")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:2])))
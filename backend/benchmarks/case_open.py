@@ -0,0 +1,84 @@
+"""Case-open latency: the four separate requests the viewer used to make vs one /cases/{id}/snapshot.
+
+Runs the app in-process over httpx's ASGI transport against the database seeded by
+benchmarks.index_plans (throwaway database only). Network round trips are
+modelled by sleeping `rtt_ms` per HTTP request:
+    export BENCH_DATABASE_URL=postgresql+asyncpg://user:pw@localhost/pathology_bench
+    python -m benchmarks.case_open [rtt_ms]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+BENCH_URL = os.getenv("BENCH_DATABASE_URL")
+if BENCH_URL:
+    os.environ["ASYNC_DATABASE_URL"] = BENCH_URL   # db.session builds its engine at import
+
+import httpx
+import caching
+from main_server import app
+from db.session import engine
+
+REPEATS = 30
+CASE_ID = "2023-05-22--07"
+USER_ID = "bench-37"
+
+
+def separate_calls(client, rtt):
+    async def request(method, path, body=None):
+        await asyncio.sleep(rtt)
+        res = await client.request(method, path, json=body)
+        res.raise_for_status()
+        return res
+
+    async def run():
+        await asyncio.gather(
+            request("POST", "/get-images", {"case_id": CASE_ID}),
+            request("POST", "/llm-history", {"case_id": CASE_ID, "user_id": USER_ID}),
+            request("POST", "/clinical-data/get", {"case_id": CASE_ID}),
+            request("POST", "/clinical-docs/retrieve", {"case_id": CASE_ID}),
+        )
+    return run
+
+
+def snapshot_call(client, rtt):
+    async def run():
+        await asyncio.sleep(rtt)
+        res = await client.get(f"/cases/{CASE_ID}/snapshot", params={"history_user_id": USER_ID})
+        res.raise_for_status()
+    return run
+
+
+async def measure(run, cold: bool):
+    timings = []
+    for _ in range(REPEATS):
+        if cold:
+            caching.clinical_cache.clear()
+        start = time.perf_counter()
+        await run()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+async def main(rtt_ms=20.0):
+    if not BENCH_URL:
+        raise SystemExit("set BENCH_DATABASE_URL to a throwaway database")
+    rtt = rtt_ms / 1000
+    transport = httpx.ASGITransport(app=app)
+    print(f"rtt {rtt_ms} ms per request, {REPEATS} runs")
+    print(f"{'variant':<28}{'median ms':>12}{'max ms':>10}")
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for label, make in (("4 requests (parallel)", separate_calls), ("snapshot", snapshot_call)):
+                for cold in (True, False):
+                    median, worst = await measure(make(client, rtt), cold)
+                    name = f"{label}, {'cold' if cold else 'warm'} cache"
+                    print(f"{name:<28}{median:>12.1f}{worst:>10.1f}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(float, sys.argv[1:2])))
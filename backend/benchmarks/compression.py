@@ -0,0 +1,66 @@
+"""Bytes on the wire vs CPU for compressing typical JSON responses.
+
+For each payload and encoder setting prints the compressed size, compression time and
+the total time to deliver it (compress + transfer) over a slow and a fast link:
+    python -m benchmarks.compression [rounds]
+"""
+import sys
+import time
+import zlib
+
+import orjson
+
+from benchmarks.serialization import make_history
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+LINKS = (("2 Mbit/s", 2e6), ("50 Mbit/s", 50e6))     # busy lab Wi-Fi on a phone, wired desktop
+
+
+def payloads():
+    summary = ("Specimen: right colon, hemicolectomy. Invasive adenocarcinoma, moderately differentiated, "
+               "invading through the muscularis propria into pericolorectal tissue. Margins negative. ") * 40
+    return {
+        "history, 50 entries": orjson.dumps({"history": make_history(50), "next_cursor": None}),
+        "history, 500 entries": orjson.dumps({"history": make_history(500), "next_cursor": None}),
+        "doc summary fields": orjson.dumps({f"field_{i}": summary[i * 50:] for i in range(12)}),
+        "clinical data": orjson.dumps({"clinical_history": summary, "specimen": "Right colon",
+                                       "clinical_impression": summary[:2000], "id": 1}),
+    }
+
+
+def encoders():
+    yield "identity", lambda body: body
+    for level in (1, 6, 9):
+        yield f"gzip {level}", lambda body, level=level: zlib.compress(body, level, wbits=16 + zlib.MAX_WBITS)
+    if brotli is not None:
+        for quality in (4, 5, 11):
+            yield f"br {quality}", lambda body, quality=quality: brotli.compress(body, quality=quality)
+
+
+def bench(encode, body, rounds):
+    encode(body)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        out = encode(body)
+    return (time.perf_counter() - start) / rounds * 1000, len(out)
+
+
+def main(rounds=50):
+    if brotli is None:
+        print("brotli not installed, gzip only")
+    header = "".join(f"{'ms @ ' + name:>16}" for name, _ in LINKS)
+    for label, body in payloads().items():
+        print(f"\n{label} ({len(body)} bytes)")
+        print(f"{'encoding':<12}{'bytes':>10}{'ratio':>8}{'cpu ms':>9}{header}")
+        for name, encode in encoders():
+            ms, size = bench(encode, body, rounds)
+            totals = "".join(f"{ms + size * 8 / bps * 1000:>16.1f}" for _, bps in LINKS)
+            print(f"{name:<12}{size:>10}{len(body) / size:>8.1f}{ms:>9.2f}{totals}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:2]))
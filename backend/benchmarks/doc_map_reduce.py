@@ -0,0 +1,43 @@
+"""Wall-clock of the single-call doc summary vs map-reduce mode on a large chart.
+
+Uses the fake LLM client, so only the orchestration is measured, not model quality.
+Times are reported in unscaled seconds when BENCH_TIME_SCALE is set.
+run from backend/:  python -m benchmarks.doc_map_reduce [n_docs]
+"""
+import asyncio
+import sys
+import time
+import llm_from_docs
+import llm_providers
+from benchmarks.doc_retrieval_tokens import make_chart, FIELDS, SPECIMEN
+from benchmarks.fake_llm import FakeAsyncOpenAI, TIME_SCALE
+
+
+async def timed(label, make_call):
+    fake = FakeAsyncOpenAI()
+    llm_providers.router = llm_providers.Router([llm_providers.Provider("fake", client=fake)])
+    start = time.perf_counter()
+    result = await make_call()
+    elapsed = time.perf_counter() - start
+    elapsed /= TIME_SCALE
+    print(f"{label:<34}{elapsed:>8.1f}s{fake.calls:>7} calls{fake.peak_in_flight:>5} peak  fields: {', '.join(result)}")
+
+
+async def main(n_docs: int = 60):
+    docs = make_chart(n_docs)
+    print(f"{n_docs} documents, fields: {', '.join(FIELDS)}")
+
+    llm_from_docs.RETRIEVAL_ENABLED = False
+    await timed("single call, all text", lambda: llm_from_docs.summarize_single(FIELDS, SPECIMEN, docs, "bench"))
+    llm_from_docs.RETRIEVAL_ENABLED = True
+    await timed("single call, retrieval", lambda: llm_from_docs.summarize_single(FIELDS, SPECIMEN, docs, "bench"))
+
+    for concurrency in (1, 4, 8, 16):
+        llm_from_docs.MAP_CONCURRENCY = concurrency
+        llm_from_docs._llm_slots = asyncio.Semaphore(concurrency)
+        await timed(f"map-reduce, concurrency {concurrency}",
+                    lambda: llm_from_docs.summarize_map_reduce(FIELDS, SPECIMEN, docs, "bench"))
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 60))
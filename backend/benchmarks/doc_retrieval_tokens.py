@@ -0,0 +1,69 @@
+"""Tokens per doc query with and without the chunk index.
+
+run from backend/:  python -m benchmarks.doc_retrieval_tokens [n_docs]
+"""
+import random
+import sys
+from datetime import date, timedelta
+import doc_index
+
+FIELDS = ["summary", "procedure", "pathology", "imaging", "labs"]
+SPECIMEN = {"summary": "Left breast, core needle biopsy", "date": "2025-06-02"}
+
+TEMPLATES = {
+    "Progress note": [
+        "Patient seen in clinic on {d}. History of hypertension and type 2 diabetes, medications reviewed.",
+        "Assessment and plan: follow up in three months, continue current medications, diet counselling given.",
+        "Review of systems negative for fever, chills, weight loss. Social history: non-smoker, occasional alcohol.",
+    ],
+    "Lab report": [
+        "Collected {d}. CBC: WBC 6.1, hemoglobin 12.9, platelet 233. Reference range within normal limits.",
+        "Basic metabolic panel {d}: sodium 139, potassium 4.2, creatinine 0.8, glucose 131 (high).",
+        "Tumor markers {d}: CEA 2.1, CA 15-3 18. Lab result reviewed by ordering provider.",
+    ],
+    "Radiology report": [
+        "Exam date {d}. Bilateral diagnostic mammogram and ultrasound of the left breast.",
+        "Findings: 1.4 cm irregular mass at 2 o'clock left breast with spiculated margins. BIRADS 5.",
+        "Impression: highly suspicious lesion, ultrasound guided core biopsy recommended.",
+    ],
+    "Pathology report": [
+        "Surgical pathology, received {d}. Specimen: left breast core biopsy, 4 cores.",
+        "Diagnosis: invasive ductal carcinoma, Nottingham grade 2. Immunohistochemistry stain ER positive, HER2 negative.",
+        "Margins not applicable on core specimen. Histology reviewed at intradepartmental consensus.",
+    ],
+    "Procedure note": [
+        "Procedure performed {d}: ultrasound guided core needle biopsy of the left breast, 14 gauge.",
+        "Local anesthesia with lidocaine, four cores obtained and sent to pathology in formalin. Clip placed.",
+        "No immediate complications, patient tolerated the procedure well.",
+    ],
+}
+
+
+def make_chart(n_docs: int, seed: int = 7) -> list[dict]:
+    rnd = random.Random(seed)
+    start = date(2022, 6, 1)
+    docs = []
+    for i in range(n_docs):
+        kind = rnd.choice(list(TEMPLATES))
+        d = (start + timedelta(days=rnd.randint(0, 1100))).isoformat()
+        paragraphs = [rnd.choice(TEMPLATES[kind]).format(d=d) + " " + " ".join(
+            rnd.choice(TEMPLATES["Progress note"]).format(d=d) for _ in range(4)) for _ in range(12)]
+        docs.append({"id": i, "title": f"{kind} {i:03d}", "doc_type": "txt", "path": f"{i:03d}.txt",
+                     "text": "\n\n".join(paragraphs)})
+    return docs
+
+
+def main(n_docs: int = 60):
+    docs = make_chart(n_docs)
+    full = sum(doc_index.estimate_tokens(d["text"]) for d in docs)
+    index = doc_index.get_case_index("bench", docs)
+    print(f"{n_docs} documents, {len(index.chunks)} chunks, {full} tokens of document text")
+    print(f"{'fields':<48}{'all docs':>10}{'retrieved':>11}{'ratio':>8}")
+    for fields in (["pathology"], ["labs"], ["imaging", "procedure"], FIELDS):
+        excerpts = index.retrieve_for_fields(fields, SPECIMEN, top_k=6)
+        sent = sum(doc_index.estimate_tokens(e["text"]) for e in excerpts)
+        print(f"{', '.join(fields):<48}{full:>10}{sent:>11}{sent / full:>8.1%}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 60)
@@ -0,0 +1,84 @@
+"""In-process stand-in for openai.AsyncOpenAI with a simple latency model.
+
+latency = overhead + prompt_tokens / prefill_tps + completion_tokens / decode_tps
+BENCH_TIME_SCALE shrinks every sleep (e.g. 0.1) for quick runs; ratios stay the same.
+"""
+import asyncio
+import json
+import os
+import re
+from itertools import count
+from types import SimpleNamespace
+
+_FIELDS_RE = re.compile(r"following fields: ([a-z_]+(?:, [a-z_]+)*)")
+TIME_SCALE = float(os.getenv("BENCH_TIME_SCALE", "1"))
+_WORDS = "patient specimen biopsy carcinoma margin imaging lesion grade result dated noted".split()
+
+
+def _filler(n_tokens: int) -> str:
+    return " ".join(_WORDS[i % len(_WORDS)] for i in range(n_tokens))
+
+
+def _prompt_text(messages) -> str:
+    parts = []
+    for m in messages:
+        content = m["content"]
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts += [c.get("text", "") for c in content if c.get("type") == "text"]
+    return "\n".join(parts)
+
+
+class FakeAsyncOpenAI:
+    def __init__(self, overhead=0.4, prefill_tps=8000, decode_tps=80,
+                 field_tokens=300, extract_tokens=60):
+        self.overhead = overhead
+        self.prefill_tps = prefill_tps
+        self.decode_tps = decode_tps
+        self.field_tokens = field_tokens        # a "thorough" field summary
+        self.extract_tokens = extract_tokens    # per-field notes pulled from one document
+        self.calls = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._file_ids = count(1)
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+        self.files = SimpleNamespace(create=self._upload)
+
+    async def _upload(self, file, purpose):
+        file.close()
+        return SimpleNamespace(id=f"file-{next(self._file_ids)}")
+
+    def plan(self, messages, response_format=None) -> tuple[str, int, int]:
+        """(content, prompt tokens, completion tokens) for a chat request."""
+        prompt = _prompt_text(messages)
+        match = _FIELDS_RE.search(prompt)
+        fields = match[1].split(", ") if match else []
+        per_field = self.extract_tokens if "extract the information" in prompt else self.field_tokens
+
+        if fields and (response_format or "JSON object" in prompt):
+            content = json.dumps({f: _filler(per_field) for f in fields})
+            out_tokens = per_field * len(fields)
+        else:
+            content = _filler(self.field_tokens)
+            out_tokens = self.field_tokens
+        return content, len(prompt) // 4, out_tokens
+
+    def latency(self, in_tokens: int, out_tokens: int) -> float:
+        return (self.overhead + in_tokens / self.prefill_tps + out_tokens / self.decode_tps) * TIME_SCALE
+
+    async def _create(self, model, messages, response_format=None, stream=False, **kwargs):
+        content, in_tokens, out_tokens = self.plan(messages, response_format)
+
+        self.calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency(in_tokens, out_tokens))
+        finally:
+            self.in_flight -= 1
+
+        usage = SimpleNamespace(prompt_tokens=in_tokens, completion_tokens=out_tokens,
+                                total_tokens=in_tokens + out_tokens)
+        message = SimpleNamespace(content=content)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
@@ -0,0 +1,125 @@
+"""OpenAI-compatible HTTP stand-in for benchmarks, same latency model as benchmarks.fake_llm.
+
+Serves /v1/chat/completions (plain and streamed) and /v1/files, so the real server
+can be pointed at it with OPENAI_BASE_URL=http://127.0.0.1:<port>/v1:
+    python -m benchmarks.fake_openai_server --port 8100 --overhead 0.4 --decode-tps 80
+Streamed answers pay overhead + prefill up front, then decode time per chunk.
+--error-rate answers that share of completions with a 503, as an overloaded server would.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from itertools import count
+from uuid import uuid4
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from benchmarks.fake_llm import FakeAsyncOpenAI, TIME_SCALE
+
+IMAGE_TOKENS = 765          # one high-detail image
+CHUNK_WORDS = 8
+
+app = FastAPI()
+app.state.model = FakeAsyncOpenAI()
+app.state.error_rate = 0.0
+_file_ids = count(1)
+
+
+def _image_count(messages) -> int:
+    return sum(1 for m in messages if not isinstance(m["content"], str)
+               for part in m["content"] if part.get("type") in ("image_url", "file"))
+
+
+def _usage(in_tokens, out_tokens):
+    return {"prompt_tokens": in_tokens, "completion_tokens": out_tokens, "total_tokens": in_tokens + out_tokens}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = app.state.model
+    if random.random() < app.state.error_rate:
+        return JSONResponse({"error": {"message": "overloaded", "type": "server_error"}}, status_code=503)
+    content, in_tokens, out_tokens = model.plan(body["messages"], body.get("response_format"))
+    in_tokens += IMAGE_TOKENS * _image_count(body["messages"])
+    completion_id = f"chatcmpl-{uuid4().hex[:12]}"
+    created = int(time.time())
+
+    model.calls += 1
+    model.in_flight += 1
+    model.peak_in_flight = max(model.peak_in_flight, model.in_flight)
+
+    if not body.get("stream"):
+        try:
+            await asyncio.sleep(model.latency(in_tokens, out_tokens))
+        finally:
+            model.in_flight -= 1
+        return JSONResponse({
+            "id": completion_id, "object": "chat.completion", "created": created, "model": body["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": _usage(in_tokens, out_tokens),
+        })
+
+    include_usage = (body.get("stream_options") or {}).get("include_usage", False)
+
+    def chunk(delta, finish_reason=None, usage=None):
+        choices = [] if usage else [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        data = {"id": completion_id, "object": "chat.completion.chunk", "created": created,
+                "model": body["model"], "choices": choices, "usage": usage}
+        return f"data: {json.dumps(data)}\n\n"
+
+    async def events():
+        try:
+            await asyncio.sleep(model.latency(in_tokens, 0))
+            words = content.split(" ")
+            pieces = [" ".join(words[i:i + CHUNK_WORDS]) + " " for i in range(0, len(words), CHUNK_WORDS)]
+            per_piece = out_tokens / model.decode_tps / max(len(pieces), 1) * TIME_SCALE
+            yield chunk({"role": "assistant", "content": ""})
+            for piece in pieces:
+                await asyncio.sleep(per_piece)
+                yield chunk({"content": piece})
+            yield chunk({}, "stop")
+            if include_usage:
+                yield chunk({}, usage=_usage(in_tokens, out_tokens))
+            yield "data: [DONE]\n\n"
+        finally:
+            model.in_flight -= 1
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/v1/files")
+async def upload_file(request: Request):
+    size = len(await request.body())
+    return {"id": f"file-{next(_file_ids)}", "object": "file", "bytes": size, "created_at": int(time.time()),
+            "filename": "upload", "purpose": "user_data", "status": "processed"}
+
+
+@app.get("/stats")
+async def stats():
+    model = app.state.model
+    return {"calls": model.calls, "in_flight": model.in_flight, "peak_in_flight": model.peak_in_flight}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--overhead", type=float, default=0.4, help="seconds per call before any token")
+    parser.add_argument("--prefill-tps", type=float, default=8000)
+    parser.add_argument("--decode-tps", type=float, default=80)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of completions failing with 503")
+    args = parser.parse_args()
+
+    import uvicorn
+    app.state.model = FakeAsyncOpenAI(overhead=args.overhead, prefill_tps=args.prefill_tps,
+                                      decode_tps=args.decode_tps)
+    app.state.error_rate = args.error_rate
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
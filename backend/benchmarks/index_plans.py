@@ -0,0 +1,113 @@
+"""Query plans and latency of the hot list queries on a large seeded database.
+
+Use a throwaway Postgres database, never the real one:
+    export BENCH_DATABASE_URL=postgresql+asyncpg://user:pw@localhost/pathology_bench
+    DATABASE_URL=<same url, sync driver> alembic upgrade 696bf11e1e69    # schema without the new indexes
+    python -m benchmarks.index_plans seed                                # 100k cases, 1M images, 300k history rows
+    python -m benchmarks.index_plans run before
+    DATABASE_URL=... alembic upgrade head
+    python -m benchmarks.index_plans run after
+Each run prints the EXPLAIN (ANALYZE, BUFFERS) plans and median latencies and
+writes them to index_plans_<label>.json.
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+BENCH_URL = os.getenv("BENCH_DATABASE_URL")
+N_CASES = 100_000
+N_IMAGES = 1_000_000
+N_HISTORY = 300_000
+N_USERS = 50
+REPEATS = 25
+
+# case g -> '2020-01-01' + g/40 days, 40 cases per day
+CASE_ID_SQL = "to_char(date '2020-01-01' + ({g} % {n} / 40), 'YYYY-MM-DD') || '--' || lpad(({g} % {n} % 40 + 1)::text, 2, '0')"
+
+SEED = [
+    f"""INSERT INTO users (user_id, settings)
+        SELECT 'bench-' || u, '{{}}' FROM generate_series(1, {N_USERS}) u ON CONFLICT DO NOTHING""",
+    f"""INSERT INTO cases (case_id, created, updated, user_id)
+        SELECT {CASE_ID_SQL.format(g='g', n=N_CASES)}, now() - g * interval '1 minute',
+               now() - g * interval '1 minute', 'bench-' || (g % {N_USERS} + 1)
+        FROM generate_series(0, {N_CASES - 1}) g""",
+    f"""INSERT INTO images (case_id, user_id, filename, rel_path, uploaded)
+        SELECT {CASE_ID_SQL.format(g='g', n=N_CASES)}, 'bench-' || (g % {N_USERS} + 1),
+               md5(g::text) || '.png', '/images/bench/' || md5(g::text) || '.png', now() - g * interval '1 second'
+        FROM generate_series(0, {N_IMAGES - 1}) g""",
+    f"""INSERT INTO llm_history (case_id, user_id, start_ts, end_ts, prompt, image_count, response)
+        SELECT {CASE_ID_SQL.format(g='g', n=N_CASES)}, 'bench-' || (g % {N_USERS} + 1),
+               now() - g * interval '1 second', now() - g * interval '1 second',
+               'prompt ' || g, g % 4, repeat('response text ', 20)
+        FROM generate_series(0, {N_HISTORY - 1}) g""",
+    "ANALYZE",
+]
+
+# case 2023-05-22--07 is g = 49486, owned by bench-37 like its 10 images and 3 history rows
+QUERIES = {
+    "images by case+user": (
+        "SELECT filename, rel_path FROM images WHERE case_id = :case_id AND user_id = :user_id ORDER BY uploaded",
+        {"case_id": "2023-05-22--07", "user_id": "bench-37"}),
+    "history by case+user": (
+        "SELECT * FROM llm_history WHERE case_id = :case_id AND user_id = :user_id ORDER BY start_ts",
+        {"case_id": "2023-05-22--07", "user_id": "bench-37"}),
+    "cases by user": (
+        "SELECT case_id FROM cases WHERE user_id = :user_id ORDER BY updated DESC",
+        {"user_id": "bench-37"}),
+    "latest case": (
+        "SELECT case_id FROM cases ORDER BY updated DESC LIMIT 1", {}),
+    "cases for a day (LIKE)": (
+        "SELECT case_id FROM cases WHERE case_id LIKE :prefix",
+        {"prefix": "2023-05-22--%"}),
+}
+
+
+async def seed(engine):
+    async with engine.begin() as conn:
+        for stmt in SEED:
+            start = time.perf_counter()
+            await conn.execute(text(stmt))
+            print(f"{stmt.split()[0]} {stmt.split()[2] if stmt != 'ANALYZE' else ''}: {time.perf_counter() - start:.1f}s")
+
+
+async def run(engine, label):
+    results = {}
+    async with engine.connect() as conn:
+        for name, (sql, params) in QUERIES.items():
+            plan = (await conn.execute(text(f"EXPLAIN (ANALYZE, BUFFERS) {sql}"), params)).scalars().all()
+            timings = []
+            for _ in range(REPEATS):
+                start = time.perf_counter()
+                (await conn.execute(text(sql), params)).all()
+                timings.append((time.perf_counter() - start) * 1000)
+            results[name] = {"median_ms": round(statistics.median(timings), 3), "plan": plan}
+            print(f"\n=== {name}: median {results[name]['median_ms']} ms")
+            print("\n".join(plan))
+
+    with open(f"index_plans_{label}.json", "w") as fh:
+        json.dump(results, fh, indent=2)
+    print(f"\n{'query':<28}{'median ms':>12}")
+    for name, r in results.items():
+        print(f"{name:<28}{r['median_ms']:>12}")
+
+
+async def main(command, label="run"):
+    if not BENCH_URL:
+        raise SystemExit("set BENCH_DATABASE_URL to a throwaway database")
+    engine = create_async_engine(BENCH_URL)
+    try:
+        if command == "seed":
+            await seed(engine)
+        else:
+            await run(engine, label)
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*sys.argv[1:3]))
@@ -0,0 +1,117 @@
+"""Latency and payload size of the list endpoints: full entities vs projected columns vs keyset pages.
+
+Runs against the database seeded by benchmarks.index_plans (throwaway database only):
+    export BENCH_DATABASE_URL=postgresql+asyncpg://user:pw@localhost/pathology_bench
+    python -m benchmarks.index_plans seed
+    python -m benchmarks.list_pagination [page_size]
+Before timing, every list is walked page by page through next_cursor and has to match the unpaged list.
+"""
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+BENCH_URL = os.getenv("BENCH_DATABASE_URL")
+if BENCH_URL:
+    os.environ["ASYNC_DATABASE_URL"] = BENCH_URL   # db.session builds its engine at import
+
+from sqlalchemy import select
+import functions
+from db.models import Case, Image
+from db.session import AsyncSessionMaker, engine
+
+REPEATS = 15
+USER_ID = "bench-37"
+CASE_ID = "2023-05-22--07"
+
+
+def _size(body) -> int:
+    return len(json.dumps(body, default=str).encode())
+
+
+def _entity_dict(obj):
+    return {c.key: getattr(obj, c.key) for c in obj.__table__.columns}
+
+
+async def old_cases(session):
+    cases = (await session.scalars(select(Case).where(Case.user_id == USER_ID).order_by(Case.updated.desc()))).all()
+    return {"cases": [case.case_id for case in cases]}
+
+
+async def old_images(session):
+    stmt = select(Image).where(Image.case_id == CASE_ID, Image.user_id == USER_ID).order_by(Image.uploaded)
+    images = (await session.scalars(stmt)).all()
+    return {"images": [{"filename": img.filename, "url": img.rel_path} for img in images]}
+
+
+async def old_history(session):
+    history = await functions.load_history(CASE_ID, USER_ID, True, session)
+    return {"history": [_entity_dict(h) for h in history]}
+
+
+def new(kind, limit):
+    async def call(session):
+        if kind == "cases":
+            items, cursor = await functions.list_cases_page(USER_ID, None, limit, session)
+        elif kind == "images":
+            items, cursor = await functions.list_images_page(CASE_ID, USER_ID, None, limit, session)
+        else:
+            items, cursor = await functions.list_history_page(CASE_ID, USER_ID, None, limit, session)
+        return {kind: items, "next_cursor": cursor}
+    return call
+
+
+async def walk(kind, limit):
+    """Follow next_cursor to the end; the pages together have to equal the unpaged list."""
+    list_page = {"cases": lambda c, l, s: functions.list_cases_page(USER_ID, c, l, s),
+                 "images": lambda c, l, s: functions.list_images_page(CASE_ID, USER_ID, c, l, s),
+                 "history": lambda c, l, s: functions.list_history_page(CASE_ID, USER_ID, c, l, s)}[kind]
+    async with AsyncSessionMaker() as session:
+        everything, _ = await list_page(None, None, session)
+        walked, cursor, pages = [], None, 0
+        while True:
+            items, cursor = await list_page(cursor, limit, session)
+            walked += items
+            pages += 1
+            if cursor is None:
+                break
+    return pages, walked == everything
+
+
+async def measure(fn):
+    timings = []
+    for _ in range(REPEATS):
+        async with AsyncSessionMaker() as session:
+            start = time.perf_counter()
+            body = await fn(session)
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), _size(body)
+
+
+async def main(page_size=50):
+    if not BENCH_URL:
+        raise SystemExit("set BENCH_DATABASE_URL to a throwaway database")
+    variants = {
+        "cases":   {"full entities": old_cases,   "projected": new("cases", None),   f"page {page_size}": new("cases", page_size)},
+        "images":  {"full entities": old_images,  "projected": new("images", None),  f"page {page_size}": new("images", page_size)},
+        "history": {"full entities": old_history, "projected": new("history", None), f"page {page_size}": new("history", page_size)},
+    }
+    try:
+        for kind in variants:
+            pages, same = await walk(kind, page_size)
+            print(f"{kind:<10}walked {pages} pages of {page_size}: {'ok' if same else 'MISMATCH'}")
+            if not same:
+                raise SystemExit(f"paging through {kind} does not give the unpaged list")
+        print(f"{'endpoint':<10}{'variant':<16}{'median ms':>12}{'bytes':>12}")
+        for kind, fns in variants.items():
+            for label, fn in fns.items():
+                ms, size = await measure(fn)
+                print(f"{kind:<10}{label:<16}{ms:>12.2f}{size:>12}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:2])))
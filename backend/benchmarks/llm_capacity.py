@@ -0,0 +1,49 @@
+"""Concurrent LLM query capacity with a small pool: session held for the whole
+upstream call (old /query-llm) vs short load / persist phases (current flow).
+
+    DB_POOL_SIZE=2 DB_MAX_OVERFLOW=0 DB_POOL_TIMEOUT=3 python -m benchmarks.llm_capacity 50 5
+args: concurrent requests, seconds per fake LLM call
+Needs ASYNC_DATABASE_URL pointing at a reachable database.
+"""
+import asyncio
+import sys
+import time
+from sqlalchemy import text
+from db.session import AsyncSessionMaker, pool_status, pool_stats, engine
+from benchmarks.pool_load import fake_llm_request
+
+
+async def phased_llm_request(llm_seconds: float) -> str:
+    try:
+        async with AsyncSessionMaker() as session:       # load context
+            await session.execute(text("SELECT 1"))
+        await asyncio.sleep(llm_seconds)                  # upstream call, no connection held
+        async with AsyncSessionMaker() as session:       # persist result
+            await session.execute(text("SELECT 1"))
+            await session.commit()
+        return "ok"
+    except Exception as e:
+        return type(e).__name__
+
+
+async def run(label, request, concurrency, llm_seconds):
+    pool_stats.__init__()
+    start = time.perf_counter()
+    results = await asyncio.gather(*[request(llm_seconds) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    status = pool_status()
+    print(f"{label:<16}{results.count('ok'):>5}/{concurrency:<5}{elapsed:>9.1f}s"
+          f"{status['peak_checked_out']:>7}{status['timeouts']:>10}{status['wait_max_ms']:>12.0f}")
+
+
+async def main(concurrency: int = 50, llm_seconds: float = 5.0):
+    print(f"pool size {engine.sync_engine.pool.size()}, {concurrency} concurrent queries x {llm_seconds}s")
+    print(f"{'pattern':<16}{'ok':>5}{'':<6}{'wall':>9}{'peak':>8}{'timeouts':>10}{'max wait ms':>12}")
+    await run("held session", fake_llm_request, concurrency, llm_seconds)
+    await run("short phases", phased_llm_request, concurrency, llm_seconds)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 50, float(args[1]) if len(args) > 1 else 5.0))
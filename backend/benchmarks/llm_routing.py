@@ -0,0 +1,96 @@
+"""Provider routing in llm_providers against local fake OpenAI-compatible servers.
+
+Starts a fast "lan" and a slower "cloud" benchmarks.fake_openai_server and sends the
+same queries through the router in a few set-ups: a plain fallback chain, latency
+based selection, "lan" answering 503s, "lan" going away mid-run, and image queries
+when "lan" has no vision model. Reports latency, errors seen by the caller and
+where the calls went:
+    python -m benchmarks.llm_routing [queries]
+BENCH_TIME_SCALE (see benchmarks.fake_llm) shrinks the fake servers' sleeps.
+"""
+import asyncio
+import math
+import os
+import subprocess
+import sys
+import time
+from collections import Counter
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")     # the default provider is built at import
+
+import llm_providers
+from benchmarks.suite import BACKEND_DIR, _free_port, _wait_ready
+
+IMAGE_PART = {"type": "image_url", "image_url": {"url": "data:image/png;base64,iVBORw0KGgo="}}
+
+
+class FakeServer:
+    def __init__(self, overhead: float, error_rate: float = 0.0):
+        self.port = _free_port()
+        self.base_url = f"http://127.0.0.1:{self.port}/v1"
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.fake_openai_server", "--port", str(self.port),
+             "--overhead", str(overhead), "--error-rate", str(error_rate)],
+            cwd=BACKEND_DIR, env={**os.environ, "PYTHONPATH": BACKEND_DIR})
+
+    async def ready(self):
+        await _wait_ready(f"http://127.0.0.1:{self.port}/stats", self.proc)
+
+    def stop(self):
+        self.proc.terminate()
+        self.proc.wait(10)
+
+
+def _provider(name, server, **caps):
+    return llm_providers.Provider(name, base_url=server.base_url, models={"default": f"{name}-model"},
+                                  files=False, timeout=30, max_retries=0, **caps)
+
+
+async def _run(router, queries, with_image=False, after_first=None):
+    latencies, errors, used = [], 0, Counter()
+    content = [{"type": "text", "text": "Any atypia in this field?"}] + ([IMAGE_PART] if with_image else [])
+    for i in range(queries):
+        if i == 1 and after_first:
+            after_first()
+        start = time.perf_counter()
+        try:
+            response = await router.chat("query", [{"role": "user", "content": content}], max_completion_tokens=1000)
+            used[response.model.split("-")[0]] += 1
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    pct = lambda p: latencies[max(math.ceil(p / 100 * len(latencies)) - 1, 0)] * 1000
+    return pct(50), pct(95), errors, used
+
+
+async def main(queries: int = 40):
+    lan, cloud, flaky = FakeServer(overhead=0.1), FakeServer(overhead=1.2), FakeServer(overhead=0.1, error_rate=0.3)
+    try:
+        await asyncio.gather(lan.ready(), cloud.ready(), flaky.ready())
+        setups = [
+            ("chain: cloud, lan", lambda: llm_providers.Router(
+                [_provider("cloud", cloud), _provider("lan", lan)], routing="order"), {}),
+            ("latency: cloud, lan", lambda: llm_providers.Router(
+                [_provider("cloud", cloud), _provider("lan", lan)], routing="latency"), {}),
+            ("chain: lan 30% 503s, cloud", lambda: llm_providers.Router(
+                [_provider("lan", flaky), _provider("cloud", cloud)], routing="order", cooldown=2), {}),
+            ("chain: lan dies, cloud", lambda: llm_providers.Router(
+                [_provider("lan", lan), _provider("cloud", cloud)], routing="order"), {"after_first": lan.stop}),
+            ("images, lan without vision", lambda: llm_providers.Router(
+                [_provider("lan", flaky, vision=False), _provider("cloud", cloud)]), {"with_image": True}),
+        ]
+        print(f"{queries} sequential queries per set-up")
+        print(f"{'set-up':<30}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}  calls")
+        for label, make_router, options in setups:
+            p50, p95, errors, used = await _run(make_router(), queries, **options)
+            calls = ", ".join(f"{name} {n}" for name, n in used.most_common())
+            print(f"{label:<30}{p50:>9.0f}{p95:>9.0f}{errors:>8}  {calls}")
+    finally:
+        for server in (lan, cloud, flaky):
+            if server.proc.poll() is None:
+                server.stop()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:2])))
@@ -0,0 +1,99 @@
+"""Query latency of llm_processing.main with the old prints vs leveled, redacted logging.
+
+Runs a ten-image query against a stub LLM client that answers immediately, so the
+time left is image encoding, message building and logging. Log output goes to a
+temp file, as it would to a container's stdout:
+    python -m benchmarks.logging_overhead [images] [rounds]
+"""
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+from types import SimpleNamespace
+
+os.environ.setdefault("OPENAI_API_KEY", "bench")
+os.environ.setdefault("ASYNC_DATABASE_URL", "postgresql+asyncpg://bench@localhost/bench")   # never connected
+
+import llm_processing
+import llm_providers
+import log_utils
+from pydantic_models import QueryLLMPayload
+
+CASE_ID = "2025-07-01--01"
+IMAGE_BYTES = 400_000
+
+
+class StubCompletions:
+    async def create(self, **kwargs):
+        message = SimpleNamespace(content="Well-differentiated adenocarcinoma. " * 40)
+        usage = SimpleNamespace(prompt_tokens=9000, completion_tokens=300, total_tokens=9300)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage)
+
+
+def old_print(_logger, msg, value, rate=None):
+    print(f"{msg}: {value}")
+
+
+async def measure(payload, rounds):
+    timings = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        await llm_processing.main(payload)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), max(timings)
+
+
+async def main(images=10, rounds=20):
+    workdir = tempfile.mkdtemp()
+    os.chdir(workdir)
+    os.makedirs(os.path.join("storage", "images", CASE_ID))
+    names = [f"{i}.png" for i in range(images)]
+    for name in names:
+        with open(os.path.join("storage", "images", CASE_ID, name), "wb") as f:
+            f.write(os.urandom(IMAGE_BYTES))
+    payload = QueryLLMPayload(user_id="bench", case_id=CASE_ID, image_ids=names, prompt="Describe.",
+                              effort="low", max_tokens=1000, include_history=False)
+    stub = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions()))
+    llm_providers.router = llm_providers.Router([llm_providers.Provider("stub", client=stub)])
+
+    log_path = os.path.join(workdir, "out.log")
+    log_file = open(log_path, "a")
+    log_utils.setup_logging("INFO", stream=log_file)
+    root = logging.getLogger()
+    redacted_log_payload = llm_processing.log_payload
+
+    variants = (
+        ("print (before)", "INFO", old_print, None),
+        ("logging off (WARNING)", "WARNING", redacted_log_payload, None),
+        ("logging INFO", "INFO", redacted_log_payload, None),
+        ("logging DEBUG, redacted", "DEBUG", redacted_log_payload, 1.0),
+        ("DEBUG, 10% sampled", "DEBUG", redacted_log_payload, 0.1),
+    )
+    print(f"{images} images of {IMAGE_BYTES // 1000} kB, {rounds} rounds")
+    print(f"{'variant':<26}{'median ms':>11}{'max ms':>10}{'log bytes / query':>20}")
+    for label, level, log_fn, rate in variants:
+        root.setLevel(level)
+        log_utils.LOG_SAMPLE_RATE = rate or 1.0
+        llm_processing.log_payload = log_fn
+        with redirect_stdout(log_file):
+            await measure(payload, 2)     # warm up
+            log_utils.stop_logging()      # flush before reading the size
+            log_file.flush()
+            before = os.path.getsize(log_path)
+            log_utils.setup_logging(level, stream=log_file)
+            median, worst = await measure(payload, rounds)
+            log_utils.stop_logging()
+            log_file.flush()
+        written = (os.path.getsize(log_path) - before) / rounds
+        log_utils.setup_logging(level, stream=log_file)
+        print(f"{label:<26}{median:>11.1f}{worst:>10.1f}{written:>20.0f}")
+    log_utils.stop_logging()
+    log_file.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(*map(int, sys.argv[1:3])))
@@ -0,0 +1,44 @@
+"""Pool load test: N concurrent fake LLM requests, each holding a DB session
+for the whole "upstream call", the way /query-llm does.
+
+Reads the DB_POOL_* settings from the environment like the server, e.g.
+    DB_POOL_SIZE=5 DB_MAX_OVERFLOW=0 DB_POOL_TIMEOUT=5 python -m benchmarks.pool_load 40 8
+    DB_POOL_SIZE=10 DB_MAX_OVERFLOW=40 python -m benchmarks.pool_load 40 8
+args: concurrent requests, seconds per fake LLM call
+Needs ASYNC_DATABASE_URL pointing at a reachable database.
+"""
+import asyncio
+import sys
+import time
+from sqlalchemy import text
+from db.session import AsyncSessionMaker, pool_status, engine
+
+
+async def fake_llm_request(llm_seconds: float) -> str:
+    try:
+        async with AsyncSessionMaker() as session:
+            await session.execute(text("SELECT 1"))      # load context
+            await asyncio.sleep(llm_seconds)              # upstream call, session still open
+            await session.execute(text("SELECT 1"))      # persist result
+            await session.commit()
+        return "ok"
+    except Exception as e:
+        return type(e).__name__
+
+
+async def main(concurrency: int = 40, llm_seconds: float = 8.0):
+    start = time.perf_counter()
+    results = await asyncio.gather(*[fake_llm_request(llm_seconds) for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+
+    failed = {r: results.count(r) for r in set(results) if r != "ok"}
+    print(f"{concurrency} concurrent requests x {llm_seconds}s: {results.count('ok')} ok, failed {failed or 'none'}")
+    print(f"wall clock {elapsed:.1f}s (ideal {llm_seconds:.1f}s)")
+    for key, value in pool_status().items():
+        print(f"  {key:<18}{value}")
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else 40, float(args[1]) if len(args) > 1 else 8.0))
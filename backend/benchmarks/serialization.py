@@ -0,0 +1,88 @@
+"""Serialization throughput for a 500-entry /llm-history response.
+
+Compares the paths a handler's return value can take to bytes on the wire:
+  orm + jsonable_encoder   the old endpoint: LLMHistory instances, reflected by jsonable_encoder, stdlib json
+  dicts + jsonable_encoder projected rows, no response model, stdlib json
+  response model + orjson  HistoryResponse validated and dumped by pydantic-core, rendered by orjson
+  dicts + orjson           lower bound, no validation at all
+    python -m benchmarks.serialization [entries] [rounds]
+"""
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse, ORJSONResponse
+from pydantic import TypeAdapter
+
+import pydantic_models as models
+from db.models import LLMHistory
+
+
+def make_history(n: int) -> list[dict]:
+    start = datetime(2025, 7, 1, tzinfo=timezone.utc)
+    return [{
+        "id": i,
+        "user_id": f"user-{i % 5}",
+        "start_ts": start + timedelta(minutes=i),
+        "end_ts": start + timedelta(minutes=i, seconds=20),
+        "prompt": f"Describe the findings in image set {i}.",
+        "image_count": i % 4,
+        "response": "Sections show a well-differentiated adenocarcinoma with no lymphovascular invasion. " * 6,
+    } for i in range(n)]
+
+
+def orm_path(rows):
+    entries = [LLMHistory(case_id="2025-07-01--01", **row) for row in rows]
+    def run():
+        return JSONResponse(jsonable_encoder({"history": entries})).body
+    return run
+
+
+def dict_encoder_path(rows):
+    def run():
+        return JSONResponse(jsonable_encoder({"history": rows, "next_cursor": None})).body
+    return run
+
+
+def model_orjson_path(rows):
+    adapter = TypeAdapter(models.HistoryResponse)
+    def run():
+        value = adapter.validate_python({"history": rows, "next_cursor": None})
+        return ORJSONResponse(adapter.dump_python(value, mode="json")).body
+    return run
+
+
+def orjson_path(rows):
+    def run():
+        return ORJSONResponse({"history": rows, "next_cursor": None}).body
+    return run
+
+
+def bench(run, rounds):
+    run()   # warm up
+    start = time.perf_counter()
+    for _ in range(rounds):
+        body = run()
+    elapsed = time.perf_counter() - start
+    return elapsed / rounds * 1000, len(body)
+
+
+def main(entries=500, rounds=200):
+    rows = make_history(entries)
+    print(f"{entries} history entries, {rounds} rounds")
+    print(f"{'path':<28}{'ms / response':>14}{'responses / s':>15}{'bytes':>10}")
+    for label, make in (("orm + jsonable_encoder", orm_path),
+                        ("dicts + jsonable_encoder", dict_encoder_path),
+                        ("response model + orjson", model_orjson_path),
+                        ("dicts + orjson", orjson_path)):
+        try:
+            ms, size = bench(make(rows), rounds)
+        except Exception as e:
+            print(f"{label:<28}failed: {type(e).__name__}: {e}")
+            continue
+        print(f"{label:<28}{ms:>14.3f}{1000 / ms:>15.0f}{size:>10}")
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:3]))
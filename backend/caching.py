@@ -0,0 +1,196 @@
+import os
+import json
+import time
+import logging
+from collections import OrderedDict
+from uuid import uuid4
+
+log = logging.getLogger(__name__)
+
+KNOWN_CASES_MAX = int(os.getenv("KNOWN_CASES_MAX", "10000"))
+
+
+class KnownCases:
+    """Bounded LRU set of case ids already known to exist in the database.
+
+    Lets the capture / query hot path skip the case upsert entirely. Cases are
+    never deleted by the app, a stale entry only costs one upsert after discard().
+    """
+
+    def __init__(self, max_size: int = KNOWN_CASES_MAX):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, case_id) -> bool:
+        if case_id in self._ids:
+            self._ids.move_to_end(case_id)
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, case_id):
+        self._ids[case_id] = None
+        self._ids.move_to_end(case_id)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def discard(self, case_id):
+        self._ids.pop(case_id, None)
+
+
+known_cases = KnownCases()
+
+
+# ─────────────────────── read-through cache ───────────────────────
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "1024"))
+CLINICAL_CACHE_TTL = float(os.getenv("CLINICAL_CACHE_TTL", "300"))    # seconds
+SETTINGS_CACHE_TTL = float(os.getenv("SETTINGS_CACHE_TTL", "300"))
+CACHE_NOTIFIER = os.getenv("CACHE_NOTIFIER", "none")                 # "none", "local", "postgres"
+NOTIFY_CHANNEL = "cache_invalidation"
+
+
+class ReadThroughCache:
+    """TTL + LRU cache filled by an async loader on miss.
+
+    Writers call invalidate() after committing; the key is dropped here and, when
+    a notifier is attached, in every other worker too. A load that was in flight
+    while its key got invalidated is returned but not stored, so it can't put a
+    stale value back.
+    """
+
+    def __init__(self, name: str, ttl: float, max_size: int = CACHE_MAX_ENTRIES):
+        self.name = name
+        self.ttl = ttl
+        self.max_size = max_size
+        self.notifier = None
+        self._entries = OrderedDict()     # key -> (expires, value)
+        self._generation = {}             # key -> bumped on every invalidation
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, key, loader):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+        self.misses += 1
+        generation = self._generation.get(key, 0)
+        value = await loader()
+        if self._generation.get(key, 0) == generation:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return value
+
+    def drop(self, key):
+        """Local invalidation only, used for messages from other workers."""
+        self._entries.pop(key, None)
+        self._generation[key] = self._generation.get(key, 0) + 1
+
+    async def invalidate(self, key):
+        self.drop(key)
+        if self.notifier is not None:
+            await self.notifier.publish(self.name, key)
+
+    def clear(self):
+        for key in list(self._entries):
+            self.drop(key)
+
+
+clinical_cache = ReadThroughCache("clinical", CLINICAL_CACHE_TTL)
+settings_cache = ReadThroughCache("settings", SETTINGS_CACHE_TTL)
+_caches = {cache.name: cache for cache in (clinical_cache, settings_cache)}
+
+
+def _on_invalidation(cache_name: str, key: str):
+    cache = _caches.get(cache_name)
+    if cache is not None:
+        cache.drop(key)
+
+
+# ─────────────────────── invalidation notifiers ───────────────────────
+class LocalNotifier:
+    """In-process stand-in for a message bus. Notifiers sharing one `bus` list
+    deliver to each other but not to themselves, like separate workers would."""
+
+    def __init__(self, bus: list | None = None):
+        self.bus = bus if bus is not None else []
+        self.handler = None
+
+    async def start(self, handler):
+        self.handler = handler
+        self.bus.append(self)
+
+    async def publish(self, cache_name: str, key: str):
+        for peer in self.bus:
+            if peer is not self and peer.handler is not None:
+                peer.handler(cache_name, key)
+
+    async def stop(self):
+        if self in self.bus:
+            self.bus.remove(self)
+
+
+class PostgresNotifier:
+    """LISTEN/NOTIFY on a dedicated asyncpg connection, outside the session pool."""
+
+    def __init__(self, dsn: str, channel: str = NOTIFY_CHANNEL):
+        self.dsn = dsn.replace("postgresql+asyncpg://", "postgresql://")
+        self.channel = channel
+        self.origin = uuid4().hex      # skip our own notifications, we already dropped the key
+        self.conn = None
+
+    async def start(self, handler):
+        import asyncpg
+
+        def listener(_conn, _pid, _channel, payload):
+            origin, cache_name, key = json.loads(payload)
+            if origin != self.origin:
+                handler(cache_name, key)
+
+        self.conn = await asyncpg.connect(self.dsn)
+        await self.conn.add_listener(self.channel, listener)
+
+    async def publish(self, cache_name: str, key: str):
+        try:
+            await self.conn.execute("SELECT pg_notify($1, $2)", self.channel,
+                                    json.dumps([self.origin, cache_name, key]))
+        except Exception as e:
+            # other workers fall back to the TTL
+            log.warning("Cache invalidation notify failed: %s", e)
+
+    async def stop(self):
+        if self.conn is not None:
+            await self.conn.close()
+
+
+async def start_notifier(notifier=None):
+    """Attach a notifier to all caches, built from CACHE_NOTIFIER when none is given."""
+    if notifier is None:
+        if CACHE_NOTIFIER == "postgres":
+            notifier = PostgresNotifier(os.getenv("ASYNC_DATABASE_URL"))
+        elif CACHE_NOTIFIER == "local":
+            notifier = LocalNotifier()
+        else:
+            return None
+    await notifier.start(_on_invalidation)
+    for cache in _caches.values():
+        cache.notifier = notifier
+    return notifier
+
+
+async def stop_notifier():
+    notifiers = {cache.notifier for cache in _caches.values() if cache.notifier is not None}
+    for cache in _caches.values():
+        cache.notifier = None
+    for notifier in notifiers:
+        await notifier.stop()
@@ -0,0 +1,70 @@
+import asyncio
+import logging
+from datetime import datetime
+import metrics
+
+log = logging.getLogger(__name__)
+
+SEND_TIMEOUT = 5.0   # seconds, a stalled client is dropped instead of holding up the others
+
+
+class CaseEventHub:
+    """Fan-out of case change events to the /ws sockets subscribed to that case.
+
+    Each socket follows one case at a time. publish() is fire-and-forget so
+    request handlers never wait on slow clients. Subscriptions are per process,
+    like the /ws connection list itself.
+    """
+
+    def __init__(self):
+        self.subscribers: dict[str, set] = {}
+        self.case_of: dict = {}
+        self._tasks: set[asyncio.Task] = set()
+
+    def subscribe(self, ws, case_id: str):
+        self.unsubscribe(ws)
+        self.subscribers.setdefault(case_id, set()).add(ws)
+        self.case_of[ws] = case_id
+
+    def unsubscribe(self, ws):
+        case_id = self.case_of.pop(ws, None)
+        if case_id is None:
+            return
+        sockets = self.subscribers.get(case_id)
+        if sockets is not None:
+            sockets.discard(ws)
+            if not sockets:
+                del self.subscribers[case_id]
+
+    def publish(self, case_id: str, event_type: str, **payload):
+        sockets = self.subscribers.get(case_id)
+        if not sockets:
+            return
+        event = _jsonable({"type": event_type, "case_id": case_id, **payload})
+        task = asyncio.create_task(self._send_all(list(sockets), event))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send_all(self, sockets, event):
+        metrics.ws_messages.inc("out", event["type"], amount=len(sockets))
+        results = await asyncio.gather(
+            *[asyncio.wait_for(ws.send_json(event), SEND_TIMEOUT) for ws in sockets],
+            return_exceptions=True,
+        )
+        for ws, result in zip(sockets, results):
+            if isinstance(result, Exception):
+                log.info("Dropping case event subscriber: %s", type(result).__name__)
+                self.unsubscribe(ws)
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {k: _jsonable(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(v) for v in value]
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+hub = CaseEventHub()
@@ -1,11 +1,30 @@
 # backend/db/models.py
-from datetime import datetime, timezone
+from datetime import date, datetime, timezone
 from sqlalchemy.orm import registry, Mapped, mapped_column, relationship
-from sqlalchemy import String, Integer, DateTime, ForeignKey, JSON, Boolean
+from sqlalchemy import String, Integer, DateTime, Date, ForeignKey, JSON, Boolean, Text, UniqueConstraint, Index
+from sqlalchemy.types import TypeDecorator
 
 mapper_registry = registry()
 metadata = mapper_registry.metadata
 
+
+class UTCDateTime(TypeDecorator):
+    """timestamptz on Postgres; SQLite has no zone, so values are stored as UTC
+    and come back tagged UTC instead of naive."""
+    impl = DateTime(timezone=True)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value
+
+    def process_result_value(self, value, dialect):
+        if value is not None and value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value
+
+
 # ────────────────────────  USERS  ────────────────────────────
 @mapper_registry.mapped
 class User():
@@ -26,14 +45,21 @@ class User():
 @mapper_registry.mapped
 class Case():
     __tablename__ = "cases"
+    __table_args__ = (
+        # list-cases / latest case: WHERE user_id = ? ORDER BY updated DESC (btrees scan backwards)
+        Index("ix_cases_user_id_updated", "user_id", "updated"),
+        Index("ix_cases_updated", "updated"),
+        # case_id LIKE 'YYYY-MM-DD--%' can only use a btree with pattern ops under non-C collations
+        Index("ix_cases_case_id_pattern", "case_id", postgresql_ops={"case_id": "text_pattern_ops"}),
+    )
 
     case_id:  Mapped[str] = mapped_column(String, primary_key=True)
     created:  Mapped[datetime] = mapped_column(
-                   DateTime(timezone=True),
+                   UTCDateTime,
                    default=lambda: datetime.now(timezone.utc)
                )
     updated:  Mapped[datetime] = mapped_column(
-                   DateTime(timezone=True),
+                   UTCDateTime,
                    default=lambda: datetime.now(timezone.utc),
                    onupdate=lambda: datetime.now(timezone.utc)
                )
@@ -62,19 +88,35 @@ class Case():
     )
 
 
+# ─────────────────────── CASE COUNTERS ───────────────────────
+# last case number handed out per day, bumped in a single upsert so
+# concurrent "new case" requests never get the same id
+@mapper_registry.mapped
+class CaseCounter():
+    __tablename__ = "case_counters"
+
+    day:        Mapped[date] = mapped_column(Date, primary_key=True)
+    last_index: Mapped[int]  = mapped_column(Integer, default=0)
+
+
 # ────────────────────────  IMAGES  ───────────────────────────
 @mapper_registry.mapped
 class Image():
     __tablename__ = "images"
+    __table_args__ = (
+        # WHERE case_id = ? [AND user_id = ?] ORDER BY uploaded
+        Index("ix_images_case_id_uploaded", "case_id", "uploaded"),
+        Index("ix_images_case_id_user_id_uploaded", "case_id", "user_id", "uploaded"),
+    )
 
     id:        Mapped[int]      = mapped_column(primary_key=True)
-    case_id:   Mapped[str]      = mapped_column(ForeignKey("cases.case_id", ondelete="CASCADE"), index=True)
+    case_id:   Mapped[str]      = mapped_column(ForeignKey("cases.case_id", ondelete="CASCADE"))
     user_id:   Mapped[str]      = mapped_column(ForeignKey("users.user_id"))
 
     filename:  Mapped[str]      = mapped_column(String)
     rel_path:  Mapped[str]      = mapped_column(String)
     uploaded:  Mapped[datetime] = mapped_column(
-                    DateTime(timezone=True),
+                    UTCDateTime,
                     default=lambda: datetime.now(timezone.utc)
                 )
 
@@ -86,14 +128,19 @@ class Image():
 @mapper_registry.mapped
 class LLMHistory():
     __tablename__ = "llm_history"
+    __table_args__ = (
+        # WHERE case_id = ? [AND user_id = ?] ORDER BY start_ts
+        Index("ix_llm_history_case_id_start_ts", "case_id", "start_ts"),
+        Index("ix_llm_history_case_id_user_id_start_ts", "case_id", "user_id", "start_ts"),
+    )
 
     id:          Mapped[int]      = mapped_column(primary_key=True)
-    case_id:     Mapped[str]      = mapped_column(ForeignKey("cases.case_id", ondelete="CASCADE"), index=True)
+    case_id:     Mapped[str]      = mapped_column(ForeignKey("cases.case_id", ondelete="CASCADE"))
     user_id:     Mapped[str]      = mapped_column(ForeignKey("users.user_id"))
 
-    start_ts:    Mapped[datetime] = mapped_column(DateTime(timezone=True),
+    start_ts:    Mapped[datetime] = mapped_column(UTCDateTime,
                                     default=lambda: datetime.now(timezone.utc))
-    end_ts:      Mapped[datetime] = mapped_column(DateTime(timezone=True),
+    end_ts:      Mapped[datetime] = mapped_column(UTCDateTime,
                                     default=lambda: datetime.now(timezone.utc))
     prompt:      Mapped[str]
     image_count: Mapped[int]
@@ -103,6 +150,28 @@ class LLMHistory():
     user:        Mapped["User"]   = relationship(back_populates="history")
 
 
+# ─────────────────────── CASE CHANGES ────────────────────────
+# append-only log of image / history adds and removes, its id is the sync
+# cursor clients pass back as `since` to get only what changed
+@mapper_registry.mapped
+class CaseChange():
+    __tablename__ = "case_changes"
+    __table_args__ = (
+        Index("ix_case_changes_case_id_kind_id", "case_id", "kind", "id"),
+    )
+
+    id:       Mapped[int] = mapped_column(primary_key=True)
+    case_id:  Mapped[str] = mapped_column(ForeignKey("cases.case_id", ondelete="CASCADE"))
+    kind:     Mapped[str] = mapped_column(String)            # "images", "history"
+    op:       Mapped[str] = mapped_column(String)            # "add", "remove"
+    item_id:  Mapped[int] = mapped_column(Integer)           # Image.id / LLMHistory.id
+    user_id:  Mapped[str | None] = mapped_column(String, nullable=True)
+    created:  Mapped[datetime] = mapped_column(
+                  UTCDateTime,
+                  default=lambda: datetime.now(timezone.utc)
+              )
+
+
 # ─────────────────────── CLINICAL DATA ───────────────────────
 @mapper_registry.mapped
 class ClinicalData():
@@ -136,11 +205,63 @@ class ClinicalDoc():
     title:    Mapped[str]  = mapped_column(String)
     doc_type: Mapped[str]  = mapped_column(String)   # "pdf", "docx", "text", …
     location: Mapped[str]  = mapped_column(String)   # local path or S3 URL
+    content_hash: Mapped[str | None] = mapped_column(String, nullable=True)   # sha256 of the file
     uploaded: Mapped[datetime] = mapped_column(
-                   DateTime(timezone=True),
+                   UTCDateTime,
                    default=lambda: datetime.now(timezone.utc)
                )
     user: Mapped["User"] = relationship(back_populates="clin_docs")
     case: Mapped["Case"] = relationship(back_populates="clin_docs")
+    extracted_text: Mapped["ClinicalDocText"] = relationship(
+        back_populates="doc",
+        uselist=False,
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+    field_summaries: Mapped[list["DocFieldSummary"]] = relationship(
+        back_populates="doc",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+
+
+# ───────────────────── CLINICAL DOC TEXT ─────────────────────
+@mapper_registry.mapped
+class ClinicalDocText():
+    __tablename__ = "clinical_doc_text"
+
+    doc_id:    Mapped[int]  = mapped_column(
+                   ForeignKey("clinical_docs.id", ondelete="CASCADE"), primary_key=True
+               )
+    status:    Mapped[str]  = mapped_column(String, default="pending")  # "ready", "empty", "failed"
+    text:      Mapped[str]  = mapped_column(Text, default="")
+    # [{"page": 1, "paragraph": 0, "start": 0, "end": 123}, …]  (page is None for docx/txt)
+    segments:  Mapped[list] = mapped_column(JSON, default=list)
+    extracted: Mapped[datetime] = mapped_column(
+                   UTCDateTime,
+                   default=lambda: datetime.now(timezone.utc)
+               )
+
+    doc: Mapped["ClinicalDoc"] = relationship(back_populates="extracted_text")
+
+
+# ─────────────────── DOC FIELD SUMMARIES ───────────────────
+# per-document notes from the map step of doc queries, reused until the
+# document content or the specimen changes
+@mapper_registry.mapped
+class DocFieldSummary():
+    __tablename__ = "doc_field_summaries"
+    __table_args__ = (UniqueConstraint("doc_id", "content_hash", "specimen_key", "field"),)
 
+    id:           Mapped[int] = mapped_column(primary_key=True)
+    doc_id:       Mapped[int] = mapped_column(ForeignKey("clinical_docs.id", ondelete="CASCADE"))
+    content_hash: Mapped[str] = mapped_column(String)
+    specimen_key: Mapped[str] = mapped_column(String)
+    field:        Mapped[str] = mapped_column(String)
+    summary:      Mapped[str] = mapped_column(Text, default="")   # "" = nothing relevant in this doc
+    created:      Mapped[datetime] = mapped_column(
+                      UTCDateTime,
+                      default=lambda: datetime.now(timezone.utc)
+                  )
 
+    doc: Mapped["ClinicalDoc"] = relationship(back_populates="field_summaries")
@@ -1,16 +1,150 @@
 # backend/db/session.py
 import os
+import time
+import logging
+from collections import deque
 from contextlib import asynccontextmanager
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 import dotenv
+import metrics
 
 dotenv.load_dotenv()
 
 DB_URL = os.getenv("ASYNC_DATABASE_URL")
 
-engine = create_async_engine(DB_URL, future=True)
+# pool tuning, LLM requests can hold a session for tens of seconds
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))          # seconds to wait for a free connection
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))           # seconds, -1 never recycles
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+# asyncpg prepared statements cached per connection, set 0 behind pgbouncer (transaction mode)
+STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# embedded mode, ASYNC_DATABASE_URL=sqlite+aiosqlite:///storage/pathology.db for a single workstation
+IS_SQLITE = bool(DB_URL) and DB_URL.startswith("sqlite")
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",              # readers don't block the writer
+    "synchronous": "NORMAL",            # fsync at checkpoints only, safe with WAL
+    "foreign_keys": "ON",               # off by default, the ON DELETE CASCADEs rely on it
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),   # wait for the write lock instead of failing
+    "cache_size": -int(os.getenv("SQLITE_CACHE_KB", "20000")),          # negative means KiB, per connection
+    "temp_store": "MEMORY",
+    "mmap_size": int(os.getenv("SQLITE_MMAP_MB", "256")) * 1024 * 1024,
+}
+
+
+class PoolStats:
+    """Checkout wait times and saturation counters for the connection pool."""
+
+    def __init__(self, window: int = 1000):
+        self.waits = deque(maxlen=window)
+        self.wait_count = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.timeouts = 0
+        self.checked_out = 0
+        self.peak_checked_out = 0
+
+    def record_wait(self, seconds: float):
+        self.waits.append(seconds)
+        self.wait_count += 1
+        self.wait_total += seconds
+        self.wait_max = max(self.wait_max, seconds)
+
+    def on_checkout(self, *_):
+        self.checked_out += 1
+        self.peak_checked_out = max(self.peak_checked_out, self.checked_out)
+
+    def on_checkin(self, *_):
+        self.checked_out -= 1
+
+    def wait_percentile(self, pct: float) -> float:
+        if not self.waits:
+            return 0.0
+        ordered = sorted(self.waits)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Queue pool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.record_wait(time.perf_counter() - start)
+
+
+# sqlalchemy quiets only its own logger namespace, the subclass logs under ours
+logging.getLogger(f"{__name__}.InstrumentedPool").setLevel(logging.WARNING)
+
+
+def _connect_args() -> dict:
+    if DB_URL and "+asyncpg" in DB_URL:
+        return {
+            "prepared_statement_cache_size": STATEMENT_CACHE_SIZE,   # sqlalchemy's adapter cache
+            "statement_cache_size": STATEMENT_CACHE_SIZE,            # asyncpg's own cache
+        }
+    return {}
+
+
+engine = create_async_engine(
+    DB_URL,
+    future=True,
+    poolclass=InstrumentedPool,
+    pool_size=POOL_SIZE,
+    max_overflow=MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=POOL_PRE_PING,
+    connect_args=_connect_args(),
+)
+event.listen(engine.sync_engine, "checkout", pool_stats.on_checkout)
+event.listen(engine.sync_engine, "checkin", pool_stats.on_checkin)
+event.listen(engine.sync_engine, "before_cursor_execute", lambda *args: metrics.record_query())
+
+
+@event.listens_for(engine.sync_engine, "connect")
+def _sqlite_pragmas(dbapi_conn, _record):
+    if not IS_SQLITE:
+        return
+    cursor = dbapi_conn.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
 AsyncSessionMaker = async_sessionmaker(engine, expire_on_commit=False)
 
+
+def pool_status() -> dict:
+    pool = engine.sync_engine.pool
+    return {
+        "size": pool.size(),
+        "max_overflow": MAX_OVERFLOW,
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": max(pool.overflow(), 0),
+        "peak_checked_out": pool_stats.peak_checked_out,
+        "timeouts": pool_stats.timeouts,
+        "wait_count": pool_stats.wait_count,
+        "wait_avg_ms": round(1000 * pool_stats.wait_total / pool_stats.wait_count, 2) if pool_stats.wait_count else 0.0,
+        "wait_p95_ms": round(1000 * pool_stats.wait_percentile(95), 2),
+        "wait_max_ms": round(1000 * pool_stats.wait_max, 2),
+    }
+
+
 async def get_session():
     async with AsyncSessionMaker() as session:
         yield session
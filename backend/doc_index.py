@@ -0,0 +1,229 @@
+import hashlib
+import math
+import os
+import re
+from collections import Counter, OrderedDict
+from datetime import date, datetime
+from pathlib import Path
+
+# optional CPU embedding model, BM25 alone is used when these aren't installed
+try:
+    import numpy as np
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    np = None
+    SentenceTransformer = None
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHUNK_CHARS = int(os.getenv("DOC_CHUNK_CHARS", "1500"))
+EMBED_MODEL = os.getenv("DOC_EMBED_MODEL", "")          # e.g. "sentence-transformers/all-MiniLM-L6-v2"
+DATE_DECAY_DAYS = float(os.getenv("DOC_DATE_DECAY_DAYS", "180"))
+DATE_WEIGHT = float(os.getenv("DOC_DATE_WEIGHT", "0.5"))
+INDEX_DIR = Path("storage/index")
+INDEX_CACHE_CASES = int(os.getenv("DOC_INDEX_CACHE_CASES", "32"))   # indexes kept in memory, least recently used go first
+PARAGRAPH_SEP = "\n\n"   # how doc_text joins extracted paragraphs
+
+# what each clinical field is looking for in the chart
+FIELD_QUERIES = {
+    "summary":   "history presenting complaint diagnosis assessment plan impression problem list medications",
+    "procedure": "procedure operative operation biopsy excision resection endoscopy colonoscopy core needle aspiration surgery technique specimen sent",
+    "pathology": "pathology surgical cytology diagnosis carcinoma malignant benign tumor grade margin histology immunohistochemistry stain specimen",
+    "imaging":   "imaging radiology ct mri ultrasound mammogram x-ray pet scan findings impression mass lesion nodule enhancement birads",
+    "labs":      "laboratory lab result cbc hemoglobin wbc platelet creatinine glucose sodium potassium marker cea psa ca-125 reference range",
+}
+
+_BM25_K1 = 1.5
+_BM25_B = 0.75
+
+_indexes: OrderedDict[str, "CaseIndex"] = OrderedDict()
+_embedder = None
+
+
+def _tokenize(text: str) -> list[str]:
+    return re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", text.lower())
+
+
+def estimate_tokens(text: str) -> int:
+    if tiktoken is not None:
+        return len(tiktoken.get_encoding("o200k_base").encode(text))
+    return len(text) // 4
+
+
+# ───────────────────────── dates ─────────────────────────
+_MONTHS = {m: i for i, m in enumerate(
+    ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"], start=1)}
+_DATE_PATTERNS = [
+    (re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"), lambda m: (m[1], m[2], m[3])),
+    (re.compile(r"\b(\d{1,2})/(\d{1,2})/(\d{4})\b"), lambda m: (m[3], m[1], m[2])),
+    (re.compile(r"\b([A-Za-z]{3})[a-z]*\.? (\d{1,2}),? (\d{4})\b"),
+     lambda m: (m[3], _MONTHS.get(m[1].lower(), 0), m[2])),
+]
+
+
+def find_dates(text: str) -> list[date]:
+    found = []
+    for pattern, parts in _DATE_PATTERNS:
+        for m in pattern.finditer(text):
+            try:
+                y, mo, d = (int(x) for x in parts(m))
+                found.append(date(y, mo, d))
+            except ValueError:
+                continue
+    return found
+
+
+def _parse_specimen_date(value) -> date | None:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(str(value)[:10]).date()
+    except ValueError:
+        return None
+
+
+# ───────────────────────── chunking ─────────────────────────
+def chunk_document(doc: dict) -> list[dict]:
+    """Group consecutive paragraphs of a document into ~CHUNK_CHARS chunks."""
+    text = doc["text"]
+    segments = doc.get("segments")
+    if segments:
+        paragraphs = [(seg["page"], text[seg["start"]:seg["end"]]) for seg in segments]
+    else:
+        paragraphs = [(None, p) for p in text.split(PARAGRAPH_SEP) if p.strip()]
+
+    doc_dates = find_dates(text)
+    chunks, current, page = [], [], None
+    for para_page, para in paragraphs:
+        if current and sum(len(p) for p in current) + len(para) > CHUNK_CHARS:
+            chunks.append((page, PARAGRAPH_SEP.join(current)))
+            current = []
+        if not current:
+            page = para_page
+        current.append(para)
+    if current:
+        chunks.append((page, PARAGRAPH_SEP.join(current)))
+
+    out = []
+    for page, chunk_text in chunks:
+        dates = find_dates(chunk_text)
+        out.append({
+            "doc_id": doc.get("id"),
+            "title": doc["title"],
+            "page": page,
+            "text": chunk_text,
+            # fall back to the first date anywhere in the document
+            "date": dates[0] if dates else (doc_dates[0] if doc_dates else None),
+        })
+    return out
+
+
+# ───────────────────────── index ─────────────────────────
+class CaseIndex:
+    def __init__(self, case_id: str, chunks: list[dict], signature: str):
+        self.case_id = case_id
+        self.chunks = chunks
+        self.signature = signature
+        self.term_freqs = [Counter(_tokenize(c["text"])) for c in chunks]
+        self.lengths = [sum(tf.values()) for tf in self.term_freqs]
+        self.avg_len = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0
+        self.doc_freq = Counter(t for tf in self.term_freqs for t in tf)
+        self.embeddings = self._load_embeddings()
+
+    def bm25(self, query: str) -> list[float]:
+        n = len(self.chunks)
+        scores = [0.0] * n
+        for term in set(_tokenize(query)):
+            df = self.doc_freq.get(term)
+            if not df:
+                continue
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for i, tf in enumerate(self.term_freqs):
+                f = tf.get(term)
+                if f:
+                    norm = 1 - _BM25_B + _BM25_B * self.lengths[i] / self.avg_len
+                    scores[i] += idf * f * (_BM25_K1 + 1) / (f + _BM25_K1 * norm)
+        return scores
+
+    def _load_embeddings(self):
+        model = _get_embedder()
+        if model is None or not self.chunks:
+            return None
+        path = INDEX_DIR / self.case_id / f"{self.signature}.npy"
+        if path.exists():
+            return np.load(path)
+        vectors = model.encode([c["text"] for c in self.chunks], normalize_embeddings=True)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        for stale in path.parent.glob("*.npy"):
+            stale.unlink()
+        np.save(path, vectors)
+        return vectors
+
+    def _relevance(self, query: str) -> list[float]:
+        scores = self.bm25(query)
+        top = max(scores, default=0) or 1.0
+        scores = [s / top for s in scores]
+        if self.embeddings is not None:
+            q = _get_embedder().encode([query], normalize_embeddings=True)[0]
+            cosine = self.embeddings @ np.asarray(q, dtype=np.float32)
+            scores = [0.5 * s + 0.5 * max(float(c), 0.0) for s, c in zip(scores, cosine)]
+        return scores
+
+    def search(self, query: str, top_k: int, specimen_date: date | None = None) -> list[int]:
+        """Return chunk indices, best first, weighted by distance from the specimen date."""
+        scores = self._relevance(query)
+        if specimen_date is not None:
+            for i, chunk in enumerate(self.chunks):
+                if chunk["date"] is None:
+                    proximity = 0.5
+                else:
+                    proximity = 1 / (1 + abs((chunk["date"] - specimen_date).days) / DATE_DECAY_DAYS)
+                scores[i] *= 1 + DATE_WEIGHT * proximity
+        ranked = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
+        return [i for i in ranked[:top_k] if scores[i] > 0]
+
+    def retrieve_for_fields(self, fields: list[str], specimen: dict, top_k: int) -> list[dict]:
+        """Union of the top-k chunks for every field, in document order, tagged with their fields."""
+        specimen_date = _parse_specimen_date(specimen.get("date"))
+        hits: dict[int, list[str]] = {}
+        for field in fields:
+            query = f"{FIELD_QUERIES.get(field, field)} {specimen.get('summary') or ''}"
+            for i in self.search(query, top_k, specimen_date):
+                hits.setdefault(i, []).append(field)
+        return [{**self.chunks[i], "fields": hits[i]} for i in sorted(hits)]
+
+
+def _get_embedder():
+    global _embedder
+    if not EMBED_MODEL or SentenceTransformer is None:
+        return None
+    if _embedder is None:
+        _embedder = SentenceTransformer(EMBED_MODEL, device="cpu")
+    return _embedder
+
+
+def _signature(docs: list[dict]) -> str:
+    # content_hash changes with any edit; docs without one (benchmarks) fall back to hashing the text
+    key = "|".join(f"{d.get('id')}:{d.get('content_hash') or hashlib.sha1(d['text'].encode()).hexdigest()}:{d['title']}"
+                   for d in sorted(docs, key=lambda d: str(d.get("id"))))
+    return hashlib.sha1(key.encode()).hexdigest()[:16]
+
+
+def get_case_index(case_id: str, docs: list[dict]) -> CaseIndex:
+    """Build (or reuse) the chunk index for a case; docs need "text" filled in."""
+    signature = _signature(docs)
+    index = _indexes.get(case_id)
+    if index is not None and index.signature == signature:
+        _indexes.move_to_end(case_id)
+        return index
+    chunks = [chunk for doc in docs for chunk in chunk_document(doc)]
+    index = CaseIndex(case_id, chunks, signature)
+    _indexes[case_id] = index
+    _indexes.move_to_end(case_id)
+    while len(_indexes) > INDEX_CACHE_CASES:
+        _indexes.popitem(last=False)
+    return index
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import re
+from datetime import datetime, timezone
+import docx  # pip install python-docx
+from pypdf import PdfReader  # pure-python pdf parser
+from sqlalchemy.exc import IntegrityError
+from db.models import ClinicalDocText
+from db.session import AsyncSessionMaker
+
+log = logging.getLogger(__name__)
+
+# doc types we can turn into plain text locally
+TEXT_DOC_TYPES = {"pdf", "docx", "txt"}
+
+PARAGRAPH_SEP = "\n\n"
+
+# keep references to running extraction tasks so they are not garbage collected
+_extraction_tasks: set[asyncio.Task] = set()
+
+
+def _split_paragraphs(text: str) -> list[str]:
+    return [p.strip() for p in re.split(r"\n\s*\n", text) if p.strip()]
+
+
+def _read_paragraphs(path: str, doc_type: str) -> list[tuple[int | None, str]]:
+    """return [(page, paragraph_text), …] in reading order; page is 1-based for pdfs, None otherwise"""
+    doc_type = doc_type.lower()
+    if doc_type == "pdf":
+        paragraphs = []
+        for page_no, page in enumerate(PdfReader(path).pages, start=1):
+            page_text = page.extract_text() or ""
+            paragraphs += [(page_no, p) for p in _split_paragraphs(page_text)]
+        return paragraphs
+    if doc_type == "docx":
+        return [(None, p.text.strip()) for p in docx.Document(path).paragraphs if p.text.strip()]
+    if doc_type == "txt":
+        with open(path, "r", encoding="utf-8", errors="ignore") as f:
+            return [(None, p) for p in _split_paragraphs(f.read())]
+    return []
+
+
+def extract_text(path: str, doc_type: str) -> tuple[str, list[dict]]:
+    """Extract plain text plus page / paragraph offsets into that text."""
+    text_parts, segments = [], []
+    offset = 0
+    last_page = object()
+    para_idx = 0
+    for page, para in _read_paragraphs(path, doc_type):
+        if page != last_page:
+            para_idx, last_page = 0, page
+        if text_parts:
+            offset += len(PARAGRAPH_SEP)
+        segments.append({"page": page, "paragraph": para_idx, "start": offset, "end": offset + len(para)})
+        text_parts.append(para)
+        offset += len(para)
+        para_idx += 1
+    return PARAGRAPH_SEP.join(text_parts), segments
+
+
+async def extract_text_async(path: str, doc_type: str) -> tuple[str, list[dict]]:
+    # parsing is cpu bound, keep it off the event loop
+    return await asyncio.to_thread(extract_text, path, doc_type)
+
+
+async def extract_and_store(doc_id: int, path: str, doc_type: str):
+    try:
+        text, segments = await extract_text_async(path, doc_type)
+        status = "ready" if text else "empty"
+    except Exception as e:
+        log.warning("Text extraction failed for %s: %s", path, e)
+        text, segments, status = "", [], "failed"
+
+    async with AsyncSessionMaker() as session:
+        row = await session.get(ClinicalDocText, doc_id)
+        if row is None:
+            row = ClinicalDocText(doc_id=doc_id)
+            session.add(row)
+        row.status = status
+        row.text = text
+        row.segments = segments
+        row.extracted = datetime.now(timezone.utc)
+        try:
+            await session.commit()
+        except IntegrityError:
+            # document was deleted before extraction finished
+            await session.rollback()
+            log.info("Document %s no longer exists, dropping extracted text.", doc_id)
+
+
+def schedule_extraction(doc_id: int, path: str, doc_type: str):
+    """Run text extraction in the background, nothing to await for the caller."""
+    if doc_type.lower() not in TEXT_DOC_TYPES:
+        return
+    task = asyncio.create_task(extract_and_store(doc_id, path, doc_type))
+    _extraction_tasks.add(task)
+    task.add_done_callback(_extraction_tasks.discard)
@@ -1,8 +1,17 @@
-import os, json, base64
-from datetime import date
-from sqlalchemy import select, func, delete
-from db.models import Image, Case, LLMHistory, ClinicalData, ClinicalDoc
+import os, json, base64, hashlib, asyncio, logging
+from datetime import date, datetime, timezone, timedelta
+from sqlalchemy import select, insert, update, func, delete, tuple_, literal, or_, case, String
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from db.models import Image, Case, CaseCounter, CaseChange, LLMHistory, ClinicalData, ClinicalDoc, User
 from uuid import uuid4
+from fastapi import HTTPException
+from caching import known_cases, clinical_cache, settings_cache
+from case_events import hub
+from db.session import AsyncSessionMaker
+import doc_text
+
+log = logging.getLogger(__name__)
 
 async def count_images(case_id: str, session):
     stmt = (
@@ -13,17 +22,28 @@ async def count_images(case_id: str, session):
     result = await session.scalar(stmt)
     return result or 0
 
-# Check if a case exists, create it if not
+# Make sure a case exists, skipping the database when this process has already seen it
 async def check_create_case(case_id, user_id, session):
-
-    stmt = select(Case).where(Case.case_id == case_id)
-    case = (await session.execute(stmt)).scalar_one_or_none()
-    if case is None:
-        case = Case(case_id=case_id, user_id=user_id)
-        session.add(case)
-        await session.commit()
-        await session.refresh(case)
-    return case
+    if case_id in known_cases:
+        return case_id
+    await upsert_case(case_id, user_id, session)
+    await session.commit()
+    known_cases.add(case_id)
+    return case_id
+
+async def upsert_case(case_id, user_id, session):
+    # one round trip: create the case, or just bump updated if it already exists
+    now = datetime.now(timezone.utc)
+    stmt = dialect_insert(session, Case).values(case_id=case_id, user_id=user_id, created=now, updated=now)
+    stmt = stmt.on_conflict_do_update(index_elements=[Case.case_id], set_={"updated": now})
+    await session.execute(stmt)
+
+async def touch_case(case_id, user_id, session):
+    """Bump Case.updated, recreating the case if it vanished behind the known-case cache"""
+    stmt = update(Case).where(Case.case_id == case_id).values(updated=datetime.now(timezone.utc))
+    if (await session.execute(stmt)).rowcount == 0:
+        known_cases.discard(case_id)
+        await upsert_case(case_id, user_id, session)
 
 async def image_capture(payload, session):
 
@@ -44,8 +64,12 @@ async def image_capture(payload, session):
         rel_path=f"/images/{payload.case_id}/{os.path.basename(image_path)}"
     )
 
+    await touch_case(payload.case_id, payload.user_id, session)
     session.add(image)
+    await session.flush()
+    log_change(session, payload.case_id, "images", "add", image.id, payload.user_id)
     await session.commit()
+    hub.publish(payload.case_id, "image_added", image=image_item(image), user_id=payload.user_id)
 
     return image_path
 
@@ -56,78 +80,309 @@ async def find_latest_case(session):
     latest_case = result.scalar_one_or_none()
     return latest_case.case_id if latest_case else f"{date.today().isoformat()}--01"
 
+def dialect_insert(session, model):
+    """INSERT construct with on_conflict_* support for the session's backend"""
+    if session.bind.dialect.name == "sqlite":
+        return sqlite_insert(model)
+    return pg_insert(model)
+
+async def highest_case_index(day: date, session) -> int:
+    """Highest NN among the day's 'YYYY-MM-DD--NN' cases, 0 when there are none."""
+    case_ids = await session.scalars(select(Case.case_id).where(Case.case_id.like(f"{day.isoformat()}--%")))
+    suffixes = (case_id.rsplit("--", 1)[-1] for case_id in case_ids)
+    return max((int(s) for s in suffixes if s.isdigit()), default=0)
+
 async def create_new_case_number(session):
-    # Create a new case ID based on today's date and the highest index of existing cases
-    today = date.today().isoformat()
-    stmt = select(Case).where(Case.case_id.like(f"{today}--%"))
-    case_dirs = (await session.scalars(stmt)).all()
-    print('case dirs are:',case_dirs)
-
-    if case_dirs:
-        if  isinstance(case_dirs, object):
-            case_dirs = [case.case_id for case in case_dirs]
-        highest_index = max(int(d.split('--')[-1]) for d in case_dirs)
-        return f"{today}--{str(highest_index + 1).zfill(2)}"
-    return f"{today}--01"
+    # reserve the next index for today in one atomic statement, the row lock on
+    # the day's counter serialises concurrent callers
+    today = date.today()
+    # cases can also appear without the counter (the get-latest-case fallback captured
+    # into, a db migrated before today), never hand out an index at or below them
+    floor = await highest_case_index(today, session)
+    stmt = dialect_insert(session, CaseCounter).values(day=today, last_index=floor + 1)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[CaseCounter.day],
+        set_={"last_index": case((CaseCounter.last_index >= floor, CaseCounter.last_index + 1),
+                                 else_=floor + 1)},
+    ).returning(CaseCounter.last_index)
+    index = (await session.execute(stmt)).scalar_one()
+    await session.commit()
+    return f"{today.isoformat()}--{str(index).zfill(2)}"
 
 async def delete_images(payload, session):
     # Delete images in the database
     stmt = (select(Image).where(Image.case_id == payload.case_id, Image.filename.in_(payload.filenames)))
     images_to_delete = (await session.scalars(stmt)).all()
     for image in images_to_delete:
+        log_change(session, payload.case_id, "images", "remove", image.id, image.user_id)
         await session.delete(image)
-
-    stmt_remaining = (select(Image).where(Image.case_id == payload.case_id).order_by(Image.uploaded))
-    remaining_images = (await session.scalars(stmt_remaining)).all()
     await session.commit()
+    if images_to_delete:
+        hub.publish(payload.case_id, "image_deleted",
+                    ids=[img.id for img in images_to_delete],
+                    filenames=[img.filename for img in images_to_delete])
 
     for filename in payload.filenames:
         try:
             os.remove(os.path.join("storage", "images", payload.case_id, filename))
         except FileNotFoundError:
-            print(f"File {filename} not found for deletion.")
-    return [{"filename": img.filename, "url": img.rel_path} for img in remaining_images], len(remaining_images)
+            log.warning("File %s not found for deletion.", filename)
+
+    if not payload.return_images:
+        # client syncs with /cases/{id}/images?since=… instead
+        return None, None
+    remaining_images, _ = await list_images_page(payload.case_id, None, None, None, session)
+    return remaining_images, len(remaining_images)
+
+# ─────────────────────── list pages ───────────────────────
+MAX_PAGE_SIZE = 500
+
+def encode_cursor(sort_value, row_id) -> str:
+    """opaque keyset cursor: the (sort column, tiebreaker) of the last row on a page"""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, row_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str, id_type: type) -> tuple:
+    # cursors come back from clients, a mangled one is a bad request rather than a 500
+    # (binascii.Error and JSONDecodeError are ValueErrors)
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        sort_value, row_id = json.loads(raw)
+        # the tiebreaker is whatever column is paged on: int ids, or str for case ids
+        if not isinstance(row_id, id_type):
+            raise TypeError(f"cursor row id {row_id!r}")
+        return datetime.fromisoformat(sort_value), row_id
+    except (ValueError, TypeError) as e:
+        raise HTTPException(400, "invalid cursor") from e
+
+async def fetch_page(stmt, sort_col, id_col, cursor, limit, session, descending=False):
+    """Run stmt (already filtered) as one keyset page; rows must expose sort_col / id_col by name.
+    limit=None returns everything, like the endpoints did before paging."""
+    key = tuple_(sort_col, id_col)
+    if cursor:
+        # typed binds, so the timestamp is rendered the way the column stores it (matters on sqlite)
+        last = tuple_(*decode_cursor(cursor, id_col.type.python_type), types=[sort_col.type, id_col.type])
+        stmt = stmt.where(key < last if descending else key > last)
+    order = (sort_col.desc(), id_col.desc()) if descending else (sort_col, id_col)
+    stmt = stmt.order_by(*order)
+    if limit is not None:
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        stmt = stmt.limit(limit + 1)   # one extra row tells us whether there is a next page
+
+    rows = (await session.execute(stmt)).all()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]._mapping
+        next_cursor = encode_cursor(last[sort_col.key], last[id_col.key])
+    return rows, next_cursor
+
+async def list_cases_page(user_id, cursor, limit, session):
+    stmt = select(Case.case_id, Case.updated)
+    if user_id is not None:
+        stmt = stmt.where(Case.user_id == user_id)
+    rows, next_cursor = await fetch_page(stmt, Case.updated, Case.case_id, cursor, limit, session, descending=True)
+    return [row.case_id for row in rows], next_cursor
+
+async def list_images_page(case_id, user_id, cursor, limit, session):
+    stmt = select(*IMAGE_COLUMNS).where(Image.case_id == case_id)
+    if user_id:
+        stmt = stmt.where(Image.user_id == user_id)
+    rows, next_cursor = await fetch_page(stmt, Image.uploaded, Image.id, cursor, limit, session)
+    return [image_item(row) for row in rows], next_cursor
+
+def image_item(row):
+    return {"id": row.id, "filename": row.filename, "url": row.rel_path}
+
+IMAGE_COLUMNS = (Image.id, Image.filename, Image.rel_path, Image.uploaded)
+
+HISTORY_COLUMNS = (LLMHistory.id, LLMHistory.case_id, LLMHistory.user_id, LLMHistory.start_ts, LLMHistory.end_ts,
+                   LLMHistory.prompt, LLMHistory.image_count, LLMHistory.response)
+
+async def list_history_page(case_id, user_id, cursor, limit, session):
+    stmt = select(*HISTORY_COLUMNS).where(LLMHistory.case_id == case_id)
+    if user_id:
+        stmt = stmt.where(LLMHistory.user_id == user_id)
+    rows, next_cursor = await fetch_page(stmt, LLMHistory.start_ts, LLMHistory.id, cursor, limit, session)
+    return [dict(row._mapping) for row in rows], next_cursor
+
+async def append_history(case_id, user_id, prompt, response, image_count, session):
+    entry = LLMHistory(case_id=case_id, user_id=user_id, prompt=prompt,
+                       image_count=image_count, response=response)
+    session.add(entry)
+    await session.flush()
+    log_change(session, case_id, "history", "add", entry.id, user_id)
+    await session.commit()
+    hub.publish(case_id, "history_appended", entry=history_item(entry))
+    return entry
+
+def history_item(entry):
+    return {col.key: getattr(entry, col.key) for col in HISTORY_COLUMNS}
 
 async def load_history(case_id, user_id, include_user, session):
     stmt = select(LLMHistory).where(LLMHistory.case_id == case_id).order_by(LLMHistory.start_ts)
     if include_user:
         stmt = stmt.where(LLMHistory.case_id == case_id, LLMHistory.user_id == user_id).order_by(LLMHistory.start_ts)
     history = (await session.scalars(stmt)).all()
-    print(f"Loaded {len(history)} history entries for case {case_id} and user {user_id}")
+    log.debug("Loaded %d history entries for case %s and user %s", len(history), case_id, user_id)
     return history 
  
-async def clear_selected_history(case_id, user_id, selected_indices, session, summary=None):
-    if not selected_indices:
-        return
-
-    data = await load_history(case_id, None, False, session)
-    if not data:
+async def clear_selected_history(case_id, user_id, entry_ids, session, summary=None):
+    # entry_ids are LLMHistory.id values, scoped to the case so a stale id can't touch another case
+    if not entry_ids:
         return
-
-    entries_to_delete = [data[i] for i in selected_indices if i < len(data)]
-    
-    if summary and entries_to_delete:
-        # Create summary entry
-        summ_entry = LLMHistory(
-            case_id=case_id,
-            user_id=user_id,
-            prompt="Summary of LLM history",
-            image_count=sum(entry.image_count for entry in entries_to_delete),
-            response=summary,
-            start_ts=min(entry.start_ts for entry in entries_to_delete if entry.start_ts),
-            end_ts=max(entry.end_ts for entry in entries_to_delete if entry.end_ts),
-        )
-        session.add(summ_entry)
-    
-    # Delete selected entries
-    if entries_to_delete:
-        ids_to_delete = [entry.id for entry in entries_to_delete]
-        await session.execute(
-            delete(LLMHistory).where(LLMHistory.id.in_(ids_to_delete))
+    selected = (LLMHistory.case_id == case_id, LLMHistory.id.in_(entry_ids))
+
+    if summary:
+        # summary entry spans the deleted ones, aggregates computed in the database
+        summary_row = (
+            select(
+                literal(case_id, String),
+                literal(user_id, String),
+                literal("Summary of LLM history", String),
+                func.coalesce(func.sum(LLMHistory.image_count), 0),
+                literal(summary, String),
+                func.min(LLMHistory.start_ts),
+                func.max(LLMHistory.end_ts),
+            )
+            .where(*selected)
+            .having(func.count() > 0)
         )
-    
+        added = (await session.execute(insert(LLMHistory).from_select(
+            ["case_id", "user_id", "prompt", "image_count", "response", "start_ts", "end_ts"], summary_row
+        ).returning(*HISTORY_COLUMNS))).all()
+        for row in added:
+            log_change(session, case_id, "history", "add", row.id, user_id)
+    else:
+        added = []
+
+    # log the removals from the same rows, before they're gone
+    await session.execute(insert(CaseChange).from_select(
+        ["case_id", "kind", "op", "item_id", "user_id", "created"],
+        select(LLMHistory.case_id, literal("history", String), literal("remove", String),
+               LLMHistory.id, LLMHistory.user_id,
+               literal(datetime.now(timezone.utc), CaseChange.created.type)).where(*selected)))
+    removed = (await session.execute(delete(LLMHistory).where(*selected).returning(LLMHistory.id))).scalars().all()
     await session.commit()
 
+    if removed:
+        hub.publish(case_id, "history_removed", ids=removed)
+    for row in added:
+        hub.publish(case_id, "history_appended", entry=dict(row._mapping))
+
+# ─────────────────────── delta sync ─────────────────────
+# every image / history add and remove is logged in case_changes; clients keep
+# the cursor (last change id) and ask for what changed since. Ids are handed
+# out before commit so a slower transaction can commit a smaller id after a
+# client synced past it: deltas also re-send changes from the last
+# SYNC_OVERLAP seconds, which is harmless since applying a change twice is a no-op.
+SYNC_OVERLAP = float(os.getenv("SYNC_OVERLAP_SECONDS", "5"))
+# changes older than this are pruned, clients with a cursor from before get the full list again
+SYNC_RETENTION_DAYS = float(os.getenv("SYNC_RETENTION_DAYS", "30"))     # 0 keeps everything
+SYNC_PRUNE_INTERVAL = float(os.getenv("SYNC_PRUNE_INTERVAL", "3600"))   # seconds
+
+SYNC_KINDS = {
+    "images":  (Image, IMAGE_COLUMNS, Image.uploaded, image_item),
+    "history": (LLMHistory, HISTORY_COLUMNS, LLMHistory.start_ts, lambda row: dict(row._mapping)),
+}
+
+def log_change(session, case_id, kind, op, item_id, user_id):
+    session.add(CaseChange(case_id=case_id, kind=kind, op=op, item_id=item_id, user_id=user_id))
+
+async def change_state(case_id, kind, session) -> tuple[int, int]:
+    """(cursor, change count) for a case list, the count catches late commits below the cursor"""
+    row = (await session.execute(
+        select(func.coalesce(func.max(CaseChange.id), 0), func.count())
+        .where(CaseChange.case_id == case_id, CaseChange.kind == kind)
+    )).one()
+    return row[0], row[1]
+
+async def case_items_delta(kind, case_id, user_id, since, session):
+    """Full list when since is None, otherwise items added and ids removed after the cursor."""
+    model, columns, order_col, to_item = SYNC_KINDS[kind]
+    if since is None:
+        stmt = select(*columns).where(model.case_id == case_id)
+        if user_id:
+            stmt = stmt.where(model.user_id == user_id)
+        rows = (await session.execute(stmt.order_by(order_col, model.id))).all()
+        return {"items": [to_item(row) for row in rows], "removed": [], "full": True}
+    if await changes_pruned_after(since, session):
+        return await case_items_delta(kind, case_id, user_id, None, session)
+
+    overlap_start = datetime.now(timezone.utc) - timedelta(seconds=SYNC_OVERLAP)
+    stmt = (
+        select(CaseChange.op, CaseChange.item_id)
+        .where(CaseChange.case_id == case_id, CaseChange.kind == kind,
+               or_(CaseChange.id > since, CaseChange.created > overlap_start))
+        .order_by(CaseChange.id)
+    )
+    if user_id:
+        stmt = stmt.where(CaseChange.user_id == user_id)
+    added, removed = set(), set()
+    for op, item_id in (await session.execute(stmt)).all():
+        (added if op == "add" else removed).add(item_id)
+    added -= removed
+
+    items = []
+    if added:
+        stmt = select(*columns).where(model.id.in_(added)).order_by(order_col, model.id)
+        items = [to_item(row) for row in (await session.execute(stmt)).all()]
+    return {"items": items, "removed": sorted(removed), "full": False}
+
+async def changes_pruned_after(since, session) -> bool:
+    """True when rows after the cursor may have been pruned, the delta would miss them."""
+    oldest = await session.scalar(select(func.min(CaseChange.id)))
+    return oldest is None or since < oldest - 1
+
+async def prune_case_changes(session) -> int:
+    cutoff = datetime.now(timezone.utc) - timedelta(days=SYNC_RETENTION_DAYS)
+    result = await session.execute(delete(CaseChange).where(CaseChange.created < cutoff))
+    await session.commit()
+    return result.rowcount
+
+async def prune_case_changes_forever():
+    while True:
+        try:
+            async with AsyncSessionMaker() as session:
+                pruned = await prune_case_changes(session)
+            if pruned:
+                log.info("Pruned %d case changes older than %g days", pruned, SYNC_RETENTION_DAYS)
+        except Exception:
+            log.exception("Could not prune case changes")
+        await asyncio.sleep(SYNC_PRUNE_INTERVAL)
+
+# ─────────────────────── case snapshot ─────────────────────
+async def get_case_snapshot(case_id, images_user_id=None, history_user_id=None, limit=None):
+    """Everything the viewer needs when a case opens, each part on its own session so they run concurrently"""
+    async def run(load):
+        async with AsyncSessionMaker() as session:
+            return await load(session)
+
+    async def with_sync_cursor(kind, load, s):
+        # cursor read before the list, anything newer is picked up by the next delta
+        cursor, _ = await change_state(case_id, kind, s)
+        items, next_cursor = await load(s)
+        return items, next_cursor, cursor
+
+    (images, images_next, images_sync), (history, history_next, history_sync), clinical, docs = await asyncio.gather(
+        run(lambda s: with_sync_cursor("images", lambda s: list_images_page(case_id, images_user_id, None, limit, s), s)),
+        run(lambda s: with_sync_cursor("history", lambda s: list_history_page(case_id, history_user_id, None, limit, s), s)),
+        run(lambda s: get_clinical_data(case_id, s)),
+        run(lambda s: list_clinical_documents(case_id, s)),
+    )
+    return {
+        "case_id": case_id,
+        "images": images,
+        "history": history,
+        "clinical": clinical,
+        "docs": docs,
+        "counts": {"images": len(images), "history": len(history), "docs": len(docs)},
+        "next_cursor": {"images": images_next, "history": history_next},
+        "sync": {"images": images_sync, "history": history_sync},
+    }
+
 # ─────────────────────── clinical data ─────────────────────
 
 def _ensure_clinical_dir(case_id: str) -> str:
@@ -137,6 +392,9 @@ def _ensure_clinical_dir(case_id: str) -> str:
     return path
 
 async def get_clinical_data(case_id: str, session):
+    return await clinical_cache.get(case_id, lambda: _load_clinical_data(case_id, session))
+
+async def _load_clinical_data(case_id: str, session):
     row = await session.scalar(select(ClinicalData).where(ClinicalData.case_id == case_id))
     if row is None:
         # create default row but don't save it
@@ -164,11 +422,32 @@ async def update_clinical_fields(case_id: str, fields: dict, session):
             else:
                 setattr(row, k, v)
     await session.commit()
-    return await get_clinical_data(case_id, session)
+    await clinical_cache.invalidate(case_id)
+    data = await get_clinical_data(case_id, session)
+    # only the fields that were written, other viewers may have unsaved edits elsewhere
+    hub.publish(case_id, "clinical_updated", fields={k: data[k] for k in fields if k in data})
+    return data
+
+# ─────────────────────── user settings ─────────────────────
+async def get_user_settings(user_id: str, session):
+    async def load():
+        user = await session.scalar(select(User).where(User.user_id == user_id))
+        return user.settings if user else {}
+    return await settings_cache.get(user_id, load)
+
+async def save_user_settings(user_id: str, settings: dict, session):
+    user = await session.scalar(select(User).where(User.user_id == user_id))
+    if user is None:
+        log.info("No users found for user_id: %s, creating a new user.", user_id)
+        session.add(User(user_id=user_id, settings=settings))
+    else:
+        user.settings = settings
+    await session.commit()
+    await settings_cache.invalidate(user_id)
 
 # ───────────────────── clinical documents ─────────────────
 async def list_clinical_documents(case_id: str, session) -> int:
-    rows = await session.scalars(select(ClinicalDoc).where(ClinicalDoc.case_id == case_id))
+    rows = await session.execute(select(ClinicalDoc.title, ClinicalDoc.location).where(ClinicalDoc.case_id == case_id))
     return [{"title": row.title, "url": row.location} for row in rows]
 
 async def save_clinical_document(case_id: str, user_id: str,
@@ -187,8 +466,9 @@ async def save_clinical_document(case_id: str, user_id: str,
 
     # strip possible data‑URL prefix & decode
     b64 = data_url.split(",")[-1]
+    raw = base64.b64decode(b64)
     with open(full_path, "wb") as fh:
-        fh.write(base64.b64decode(b64))
+        fh.write(raw)
 
     rel_path = f"/clinical/{case_id}/{filename}"
 
@@ -198,9 +478,13 @@ async def save_clinical_document(case_id: str, user_id: str,
         title=filename,
         doc_type=os.path.splitext(filename)[1].lstrip("."),
         location=rel_path,
+        content_hash=hashlib.sha256(raw).hexdigest(),
     )
     session.add(doc)
     await session.commit()
+
+    # pull text out now so doc queries don't have to parse the file every time
+    doc_text.schedule_extraction(doc.id, full_path, doc.doc_type)
     return {"saved": filename, "url": rel_path}
 
 async def delete_clinical_documents(case_id: str, urls: list[str], session):
@@ -0,0 +1,107 @@
+import json
+
+_WS = " \t\r\n"
+
+
+class JsonFieldStream:
+    """Incremental parser for a streamed top-level JSON object.
+
+    feed() takes the next piece of text and returns the (key, value) pairs whose
+    values became complete with it, so callers can act on early fields while the
+    rest of the object is still being generated. A leading ```json fence is ignored.
+    """
+
+    def __init__(self):
+        self.buf = ""
+        self.pos = 0
+        self.started = False
+        self.done = False
+
+    def feed(self, chunk: str) -> list[tuple[str, object]]:
+        self.buf += chunk
+        pairs = []
+        # a value can only finish on a quote, a closing bracket or a separator
+        if not self.started or any(c in chunk for c in '"}],'):
+            while not self.done:
+                pair = self._next_pair()
+                if pair is None:
+                    break
+                pairs.append(pair)
+        return pairs
+
+    def _skip(self, p: int, chars: str) -> int:
+        while p < len(self.buf) and self.buf[p] in chars:
+            p += 1
+        return p
+
+    def _scan_string(self, p: int) -> int | None:
+        """p points at an opening quote, return the index after the closing one."""
+        i = p + 1
+        while i < len(self.buf):
+            c = self.buf[i]
+            if c == "\\":
+                i += 2
+                continue
+            if c == '"':
+                return i + 1
+            i += 1
+        return None
+
+    def _scan_value(self, p: int) -> int | None:
+        """End (exclusive) of a non-string value: object, array, number, literal."""
+        depth = 0
+        i = p
+        while i < len(self.buf):
+            c = self.buf[i]
+            if c == '"':
+                end = self._scan_string(i)
+                if end is None:
+                    return None
+                i = end
+                continue
+            if c in "{[":
+                depth += 1
+            elif c in "}]":
+                if depth == 0:
+                    return i
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            elif c == "," and depth == 0:
+                return i
+            i += 1
+        return None
+
+    def _next_pair(self):
+        if not self.started:
+            start = self.buf.find("{", self.pos)
+            if start < 0:
+                return None
+            self.pos, self.started = start + 1, True
+
+        p = self._skip(self.pos, _WS + ",")
+        if p >= len(self.buf):
+            return None
+        if self.buf[p] == "}":
+            self.done = True
+            self.pos = p + 1
+            return None
+
+        key_end = self._scan_string(p)
+        if key_end is None:
+            return None
+        key = json.loads(self.buf[p:key_end])
+
+        p = self._skip(key_end, _WS)
+        if p >= len(self.buf):
+            return None
+        p = self._skip(p + 1, _WS)   # past ':'
+        if p >= len(self.buf):
+            return None
+
+        end = self._scan_string(p) if self.buf[p] == '"' else self._scan_value(p)
+        if end is None:
+            return None
+        value = json.loads(self.buf[p:end])
+        self.pos = end
+        return key, value
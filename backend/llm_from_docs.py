@@ -1,92 +1,436 @@
-import openai
 from dotenv import load_dotenv
 import os
-import aiofiles
+import json
+import base64
+import mimetypes
+import logging
+import asyncio
+import hashlib
 from pathlib import Path
-from sqlalchemy import select
-from db.models import ClinicalDoc
-import docx  # pip install python-docx
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from db.models import ClinicalDoc, ClinicalDocText, DocFieldSummary
+from db.session import AsyncSessionMaker
+import doc_text
+import doc_index
+import metrics
+import llm_providers
+from json_stream import JsonFieldStream
+from log_utils import log_payload
+
+log = logging.getLogger(__name__)
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-client = openai.AsyncOpenAI()
 
+# only send the top-k chunks per field once the chart gets big enough to matter
+RETRIEVAL_ENABLED = os.getenv("DOC_RETRIEVAL", "1") == "1"
+RETRIEVAL_TOP_K = int(os.getenv("DOC_RETRIEVAL_TOP_K", "6"))
+RETRIEVAL_MIN_TOKENS = int(os.getenv("DOC_RETRIEVAL_MIN_TOKENS", "6000"))
+
+# map-reduce mode: parallel calls per request, and across all requests in this process.
+# on a cold cache it only keeps up with the single call at ~16 per request (benchmarks.doc_map_reduce,
+# 20 docs: single 23.4s, map-reduce 35.4s at 4, 26.2s at 8, 22.8s at 16); lower it and it is slower
+MAP_CONCURRENCY = int(os.getenv("DOC_MAP_CONCURRENCY", "16"))
+MAP_UNIT_CHARS = int(os.getenv("DOC_MAP_UNIT_CHARS", "24000"))
+_llm_slots = asyncio.Semaphore(int(os.getenv("DOC_LLM_MAX_CONCURRENCY", "32")))
+# mode for requests that don't pick one; map_reduce reuses the notes of unchanged documents, single never does
+DOC_MODE = os.getenv("DOC_LLM_MODE", "map_reduce")
+
+NO_DATA = "No relevant information found in the documents."
+
+
+async def main(case_id, user_id, selected, specimen, mode=None):
+    # short db phase, the session is closed again before any upstream call
+    with metrics.timed("docs", "context_load"):
+        async with AsyncSessionMaker() as session:
+            docs = await list_clinical_documents(case_id, session)
+    if (mode or DOC_MODE) == "map_reduce":
+        return await summarize_map_reduce(selected, specimen, docs, case_id)
+    return await summarize_single(selected, specimen, docs, case_id)
 
-async def main(case_id, user_id, selected, specimen, session):
-    docs = await list_clinical_documents(case_id, session)
-    messages = await create_messages(selected, specimen, docs)
+
+async def summarize_single(selected, specimen, docs, case_id) -> dict:
+    with metrics.timed("docs", "doc_prep"):
+        messages = await create_messages(selected, specimen, docs, case_id)
     response = await query_llm(messages)
-    print(f"LLM token usage: {response.usage}")
-    return response.choices[0].message.content
+    log.info("LLM token usage: %s", response.usage)
+    return parse_response(response.choices[0].message.content)
+
+
+async def iter_single(selected, specimen, docs, case_id):
+    """Same single call, streamed: yields (field, value) as soon as each value is complete."""
+    with metrics.timed("docs", "doc_prep"):
+        messages = await create_messages(selected, specimen, docs, case_id)
+    # only the wait for the stream to open, the rest overlaps with the client reading it
+    with metrics.timed("docs", "upstream_stream_open"):
+        stream = await llm_providers.router.chat(
+            "docs", messages, stream=True, stream_options={"include_usage": True},
+        )
+    parser = JsonFieldStream()
+    raw, sent = [], set()
+    async for chunk in stream:
+        if chunk.usage:
+            log.info("LLM token usage: %s", chunk.usage)
+            metrics.record_usage("docs", chunk.usage)
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content or ""
+        raw.append(delta)
+        for field, value in parser.feed(delta):
+            sent.add(field)
+            yield field, value
+
+    # the model didn't produce an object we could follow, parse what we got in one go
+    if not parser.done:
+        for field, value in parse_response("".join(raw)).items():
+            if field not in sent:
+                yield field, value
+
+
+async def stream_fields(selected, specimen, docs, case_id, mode=None):
+    """ndjson lines for the streaming endpoint: one per finished field, then done (or error)."""
+    fields = iter_map_reduce(selected, specimen, docs, case_id) if (mode or DOC_MODE) == "map_reduce" \
+        else iter_single(selected, specimen, docs, case_id)
+    try:
+        async for field, value in fields:
+            yield json.dumps({"field": field, "value": value}) + "\n"
+        yield json.dumps({"done": True}) + "\n"
+    except Exception as e:
+        log.exception("Error streaming doc summary for case %s", case_id)
+        yield json.dumps({"error": str(e)}) + "\n"
+
+
+def parse_response(raw: str) -> dict:
+    cleaned = raw.strip().removeprefix("```json").removesuffix("```")
+    return json.loads(cleaned)
 
 
 async def list_clinical_documents(case_id: str, session) -> list:
-    rows = await session.scalars(select(ClinicalDoc).where(ClinicalDoc.case_id == case_id))
+    stmt = (
+        select(ClinicalDoc, ClinicalDocText)
+        .outerjoin(ClinicalDocText, ClinicalDocText.doc_id == ClinicalDoc.id)
+        .where(ClinicalDoc.case_id == case_id)
+    )
+    rows = (await session.execute(stmt)).all()
     docs = []
+    backfilled = False
 
     base_path = Path("storage/clinical")
-    for row in rows:
+    for row, extracted in rows:
         file_path = base_path / row.location.replace("/clinical/", "")
         if file_path.exists():
+            if row.content_hash is None:
+                # uploaded before hashes were stored, hashed once and kept
+                row.content_hash = await asyncio.to_thread(_hash_file, file_path)
+                backfilled = True
             docs.append(
                 {
+                    "id": row.id,
                     "title": row.title,
                     "path": str(file_path),
                     "doc_type": row.doc_type,
+                    "content_hash": row.content_hash,
+                    # None until the background extraction has finished
+                    "text": extracted.text if extracted else None,
+                    "segments": extracted.segments if extracted else None,
                 }
             )
         else:
-            print(f"Warning: File not found at {file_path}")
+            log.warning("File not found at %s", file_path)
 
+    if backfilled:
+        await session.commit()
     return docs
 
 
-async def extract_text_async(path: str) -> str:
-    ext = Path(path).suffix.lower()
-    if ext == ".txt":
-        async with aiofiles.open(path, "r", encoding="utf-8", errors="ignore") as f:
-            return await f.read()
-    if ext == ".docx":
-        return "\n".join(p.text for p in docx.Document(path).paragraphs)
-    # simple fallback for .doc or unsupported: skip
-    return ""
+def _hash_file(path) -> str:
+    with open(path, "rb") as fh:
+        return hashlib.sha256(fh.read()).hexdigest()
 
 
-async def create_messages(selected_docs, specimen, docs):
-    prompt = (
-        f"Please take the attached clinical documents and generate thorough summaries for the following fields: {', '.join(selected_docs)} that are relevant to a pathology specimen: {specimen['summary']} collected on: {specimen['date']}. The output should be structured as a JSON object with the fields as keys and the values as strings (no recursive structure). Each field value should contain relevant information for the pathologist based on the provided documents. Include dates if they are provided, and sort information closer to the collection date as more relevant. The actual 'summary' field, if selected, should have an overall summary of the clinical history and all the other fields. Do not include HIPAA identifiable information (PHI) in the output."
-    )
+async def extract_text_async(doc: dict) -> str:
+    # prefer the text stored at upload time, parse on the fly for older / still pending docs
+    if doc.get("text") is not None:
+        return doc["text"]
+    if doc["doc_type"].lower() not in doc_text.TEXT_DOC_TYPES:
+        return ""
+    text, _ = await doc_text.extract_text_async(doc["path"], doc["doc_type"])
+    return text
 
-    messages = [{"role": "system", "content": "You are a medical summarizer."}]
-    content = [{"type": "text", "text": prompt}]
+
+async def prepare_documents(docs) -> tuple[list[dict], list[tuple[dict, dict]]]:
+    """Split docs into ones we have text for and (doc, file part) uploads the model reads itself."""
+    text_docs, file_parts = [], []
+    # on-prem servers usually have no Files API, images then go inline
+    uploads = llm_providers.router.can("docs", "files")
 
     for doc in docs:
         ext = doc["doc_type"].lower()
         path = doc["path"]
 
         if ext in ["jpg", "jpeg", "png", "gif", "webp"]:
-            file_ref = await client.files.create(file=open(path, "rb"), purpose="vision")
-            content.append({"type": "file", "file": {"file_id": file_ref.id}})
+            if uploads:
+                file_id = await llm_providers.router.upload_file("docs", path, purpose="vision")
+                file_parts.append((doc, {"type": "file", "file": {"file_id": file_id}}))
+            else:
+                file_parts.append((doc, await inline_image(path)))
+            continue
+
+        text = await extract_text_async(doc)
+        if text:
+            text_docs.append({**doc, "text": text})
+        elif ext == "pdf" and uploads:
+            # scanned / image-only pdf, let the model read the file itself
+            file_id = await llm_providers.router.upload_file("docs", path, purpose="user_data")
+            file_parts.append((doc, {"type": "file", "file": {"file_id": file_id}}))
         elif ext == "pdf":
-            file_ref = await client.files.create(file=open(path, "rb"), purpose="user_data")
-            content.append({"type": "file", "file": {"file_id": file_ref.id}})
-        elif ext in ["docx", "doc", "txt"]:
-            text = await extract_text_async(path)
-            if text:
-                content.append(
-                    {
-                        "type": "text",
-                        "text": f"Document: {doc['title']} (Type: {doc['doc_type']})\n{text}",
-                    }
-                )
-        else:
-            print(f"Skipping unsupported type: {ext}")
+            log.warning("Skipping %s, no text and no LLM provider takes files", doc["title"])
+        elif ext not in ["docx", "doc", "txt"]:
+            log.warning("Skipping unsupported type: %s", ext)
+
+    return text_docs, file_parts
+
+
+async def inline_image(path) -> dict:
+    data = await asyncio.to_thread(Path(path).read_bytes)
+    mime = mimetypes.guess_type(path)[0] or "image/png"
+    return {"type": "image_url", "image_url": {"url": f"data:{mime};base64,{base64.b64encode(data).decode()}"}}
+
+
+async def create_messages(selected_docs, specimen, docs, case_id):
+    prompt = (
+        f"Please take the attached clinical documents and generate thorough summaries for the following fields: {', '.join(selected_docs)} that are relevant to a pathology specimen: {specimen['summary']} collected on: {specimen['date']}. The output should be structured as a JSON object with the fields as keys and the values as strings (no recursive structure). Each field value should contain relevant information for the pathologist based on the provided documents. Include dates if they are provided, and sort information closer to the collection date as more relevant. The actual 'summary' field, if selected, should have an overall summary of the clinical history and all the other fields. Do not include HIPAA identifiable information (PHI) in the output."
+    )
 
+    messages = [{"role": "system", "content": "You are a medical summarizer."}]
+    text_docs, file_parts = await prepare_documents(docs)
+    content = [{"type": "text", "text": prompt}]
+
+    text_blocks = [
+        f"Document: {doc['title']} (Type: {doc['doc_type']})\n{doc['text']}" for doc in text_docs
+    ]
+    full_tokens = sum(doc_index.estimate_tokens(block) for block in text_blocks)
+
+    if RETRIEVAL_ENABLED and full_tokens > RETRIEVAL_MIN_TOKENS:
+        index = doc_index.get_case_index(case_id, text_docs)
+        excerpts = index.retrieve_for_fields(selected_docs, specimen, RETRIEVAL_TOP_K)
+        text_blocks = [excerpt_block(excerpt) for excerpt in excerpts]
+
+    sent_tokens = sum(doc_index.estimate_tokens(block) for block in text_blocks)
+    log.info("Doc text tokens for case %s: %d in documents, %d sent", case_id, full_tokens, sent_tokens)
+
+    # text goes right after the instructions, file uploads follow
+    content += [{"type": "text", "text": block} for block in text_blocks]
+    content += [part for _, part in file_parts]
     messages.append({"role": "user", "content": content})
     return messages
 
 
-async def query_llm(messages):
-    response = await client.chat.completions.create(model="gpt-4.1-mini", messages=messages)
-    print(f"LLM response: {response.choices[0].message.content}")
+def excerpt_block(excerpt: dict) -> str:
+    where = f", page {excerpt['page']}" if excerpt["page"] else ""
+    when = f", dated {excerpt['date'].isoformat()}" if excerpt["date"] else ""
+    return (
+        f"Excerpt from document: {excerpt['title']}{where}{when} "
+        f"(relevant to: {', '.join(excerpt['fields'])})\n{excerpt['text']}"
+    )
+
+
+async def query_llm(messages, **kwargs):
+    with metrics.timed("docs", "upstream"):
+        response = await llm_providers.router.chat("docs", messages, **kwargs)
+    metrics.record_usage("docs", response.usage)
+    log_payload(log, "LLM response", response.choices[0].message.content)
     return response
+
+
+# ───────────────────── map-reduce mode ─────────────────────
+def map_units(text_docs, file_parts) -> list[tuple[dict, str, list[dict]]]:
+    """(doc, title, parts): one unit per document, long documents split into ~MAP_UNIT_CHARS pieces."""
+    units = []
+    for doc in text_docs:
+        pieces, current = [], []
+        for chunk in doc_index.chunk_document(doc):
+            if current and sum(len(c) for c in current) + len(chunk["text"]) > MAP_UNIT_CHARS:
+                pieces.append(current)
+                current = []
+            current.append(chunk["text"])
+        if current:
+            pieces.append(current)
+        for i, piece in enumerate(pieces, start=1):
+            title = doc["title"] if len(pieces) == 1 else f"{doc['title']} (part {i} of {len(pieces)})"
+            text = doc_index.PARAGRAPH_SEP.join(piece)
+            units.append((doc, title, [{"type": "text", "text": f"Document: {title} (Type: {doc['doc_type']})\n{text}"}]))
+    for doc, part in file_parts:
+        units.append((doc, doc["title"], [part]))
+    return units
+
+
+async def _limited(request_slots, make_call):
+    async with request_slots, _llm_slots:
+        return await make_call()
+
+
+async def map_document(fields, specimen, title, parts) -> dict:
+    prompt = (
+        f"From the attached clinical document ({title}), extract the information relevant to a pathology specimen: {specimen['summary']} collected on: {specimen['date']} for the following fields: {', '.join(fields)}. Return a JSON object with exactly these fields as keys and strings as values, using an empty string when the document has nothing relevant for a field. Include dates if they are provided. Do not include HIPAA identifiable information (PHI) in the output."
+    )
+    messages = [
+        {"role": "system", "content": "You are a medical summarizer."},
+        {"role": "user", "content": [{"type": "text", "text": prompt}, *parts]},
+    ]
+    response = await query_llm(messages, response_format={"type": "json_object"})
+    try:
+        return parse_response(response.choices[0].message.content)
+    except json.JSONDecodeError:
+        log.warning("Could not parse map output for %s, skipping it", title)
+        return {}
+
+
+async def reduce_field(field, specimen, notes: list[str]) -> str:
+    if not notes:
+        return NO_DATA
+    if len(notes) == 1:
+        return notes[0]
+    joined = "\n\n".join(f"Notes from document {i}:\n{note}" for i, note in enumerate(notes, start=1))
+    prompt = (
+        f"Below are notes on '{field}' extracted from separate clinical documents for a pathology specimen: {specimen['summary']} collected on: {specimen['date']}. Merge them into one thorough '{field}' summary for the pathologist. Remove duplicated information, include dates if they are provided, and sort information closer to the collection date as more relevant. Return only the text of the summary. Do not include HIPAA identifiable information (PHI) in the output."
+    )
+    messages = [
+        {"role": "system", "content": "You are a medical summarizer."},
+        {"role": "user", "content": f"{prompt}\n\n{joined}"},
+    ]
+    response = await query_llm(messages)
+    return response.choices[0].message.content.strip()
+
+
+async def summarize_fields(specimen, field_values: dict) -> str:
+    joined = "\n\n".join(f"{field}:\n{value}" for field, value in field_values.items())
+    prompt = (
+        f"Using the field summaries below, write an overall summary of the clinical history relevant to a pathology specimen: {specimen['summary']} collected on: {specimen['date']}. Return only the text of the summary. Do not include HIPAA identifiable information (PHI) in the output."
+    )
+    messages = [
+        {"role": "system", "content": "You are a medical summarizer."},
+        {"role": "user", "content": f"{prompt}\n\n{joined}"},
+    ]
+    response = await query_llm(messages)
+    return response.choices[0].message.content.strip()
+
+
+def specimen_key(specimen: dict) -> str:
+    key = json.dumps({"summary": specimen.get("summary"), "date": specimen.get("date")}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+async def load_field_notes(docs, spec_key, fields) -> dict[int, dict[str, str]]:
+    """Cached per-document notes {doc_id: {field: note}} for the current content and specimen."""
+    hashes = {doc["id"]: doc["content_hash"] for doc in docs if doc.get("content_hash")}
+    if not hashes:
+        return {}
+    async with AsyncSessionMaker() as session:
+        rows = await session.scalars(
+            select(DocFieldSummary).where(
+                DocFieldSummary.doc_id.in_(hashes),
+                DocFieldSummary.specimen_key == spec_key,
+                DocFieldSummary.field.in_(fields),
+            )
+        )
+        notes = {}
+        for row in rows:
+            if hashes[row.doc_id] == row.content_hash:
+                notes.setdefault(row.doc_id, {})[row.field] = row.summary
+    return notes
+
+
+async def store_field_notes(doc, spec_key, notes: dict[str, str]):
+    if not doc.get("content_hash") or not notes:
+        return
+    async with AsyncSessionMaker() as session:
+        # notes for an older version of this document are dead weight now
+        await session.execute(
+            delete(DocFieldSummary).where(
+                DocFieldSummary.doc_id == doc["id"],
+                DocFieldSummary.content_hash != doc["content_hash"],
+            )
+        )
+        session.add_all([
+            DocFieldSummary(doc_id=doc["id"], content_hash=doc["content_hash"],
+                            specimen_key=spec_key, field=field, summary=note)
+            for field, note in notes.items()
+        ])
+        try:
+            await session.commit()
+        except IntegrityError:
+            # a concurrent query stored the same notes, or the doc was deleted meanwhile
+            await session.rollback()
+
+
+async def map_new_documents(docs, specimen, spec_key, map_fields, cached, request_slots):
+    """Run the map step only for (document, field) pairs missing from the cache and store the results."""
+    missing = {doc["id"]: [f for f in map_fields if f not in cached.get(doc["id"], {})] for doc in docs}
+    todo = [doc for doc in docs if missing[doc["id"]]]
+    if not todo:
+        return {}
+    with metrics.timed("docs", "doc_prep"):
+        text_docs, file_parts = await prepare_documents(todo)
+    units = map_units(text_docs, file_parts)
+
+    mapped = await asyncio.gather(*[
+        _limited(request_slots, lambda d=doc, t=title, p=parts: map_document(missing[d["id"]], specimen, t, p))
+        for doc, title, parts in units
+    ])
+
+    # combine the parts of split documents; only keep fields every part answered
+    per_doc: dict[int, list[dict]] = {}
+    for (doc, _, _), out in zip(units, mapped):
+        per_doc.setdefault(doc["id"], []).append(out)
+    fresh = {}
+    for doc in todo:
+        outs = per_doc.get(doc["id"], [])
+        notes = {
+            field: "\n\n".join(str(o[field]).strip() for o in outs if str(o[field] or "").strip())
+            for field in missing[doc["id"]]
+            if outs and all(field in o for o in outs)
+        }
+        fresh[doc["id"]] = notes
+        with metrics.timed("docs", "persist"):
+            await store_field_notes(doc, spec_key, notes)
+    return fresh
+
+
+async def iter_map_reduce(selected, specimen, docs, case_id):
+    """Yields (field, value) as each field's reduce finishes, "summary" last."""
+    # "summary" is written last from the other fields, unless it's the only one asked for
+    map_fields = [f for f in selected if f != "summary"] or ["summary"]
+    spec_key = specimen_key(specimen)
+    request_slots = asyncio.Semaphore(MAP_CONCURRENCY)
+
+    # only new or changed documents go through the map step, the rest come from the cache
+    with metrics.timed("docs", "context_load"):
+        cached = await load_field_notes(docs, spec_key, map_fields)
+    fresh = await map_new_documents(docs, specimen, spec_key, map_fields, cached, request_slots)
+    log.info("Map-reduce doc query for case %s: %d docs, %d summarized, fields %s",
+             case_id, len(docs), len(fresh), map_fields)
+    doc_notes = [{**cached.get(doc["id"], {}), **fresh.get(doc["id"], {})} for doc in docs]
+
+    async def reduce_one(field):
+        notes = [n[field].strip() for n in doc_notes if (n.get(field) or "").strip()]
+        return field, await _limited(request_slots, lambda: reduce_field(field, specimen, notes))
+
+    result = {}
+    reduce_tasks = [asyncio.create_task(reduce_one(field)) for field in map_fields]
+    try:
+        for next_done in asyncio.as_completed(reduce_tasks):
+            field, value = await next_done
+            result[field] = value
+            yield field, value
+    finally:
+        # consumer went away (e.g. client disconnected), don't leave calls running
+        for task in reduce_tasks:
+            task.cancel()
+
+    if "summary" in selected and "summary" not in result:
+        yield "summary", await _limited(request_slots, lambda: summarize_fields(specimen, result))
+
+
+async def summarize_map_reduce(selected, specimen, docs, case_id) -> dict:
+    return {field: value async for field, value in iter_map_reduce(selected, specimen, docs, case_id)}
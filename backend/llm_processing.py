@@ -1,28 +1,35 @@
-import openai
 from dotenv import load_dotenv
 import os
 import base64
+import logging
 import functions
+import metrics
+import llm_providers
 from sqlalchemy import select, func
+from db.session import AsyncSessionMaker
+from log_utils import log_payload
 
 
 load_dotenv()
-openai.api_key = os.getenv("OPENAI_API_KEY")
-client = openai.AsyncOpenAI()
+log = logging.getLogger(__name__)
 
-async def main(payload, session):
-    image_list = await process_images(payload.image_ids, payload.case_id)
+# no db session is held across the upstream calls, each db step opens its own short one
+async def main(payload):
+    with metrics.timed("query", "image_encode"):
+        image_list = await process_images(payload.image_ids, payload.case_id)
     if image_list == "failed":
         return "Error processing images: No valid images found in database."
     
-    msgs_imgs = await construct_messages(payload, image_list, session)
-    print(f"Constructed messages for LLM query: {msgs_imgs}")
-    response = await query_llm(
-        msgs_imgs,
-        payload.effort,
-        payload.max_tokens,
-    )
-    print(f"LLM token usage: {response.usage}")
+    msgs_imgs = await construct_messages(payload, image_list)
+    log_payload(log, "Constructed messages for LLM query", msgs_imgs)
+    with metrics.timed("query", "upstream"):
+        response = await query_llm(
+            msgs_imgs,
+            payload.effort,
+            payload.max_tokens,
+        )
+    log.info("LLM token usage: %s", response.usage)
+    metrics.record_usage("query", response.usage)
 
     return response.choices[0].message.content
 
@@ -48,7 +55,7 @@ async def process_images(image_ids, case_id):
     return  image_contents
 
 
-async def construct_messages(payload, image_list, session):
+async def construct_messages(payload, image_list):
     messages = [{"role": "system", "content": "Please analyze the users query and/or images."}]
 
     if payload.clinical_data:
@@ -65,7 +72,9 @@ async def construct_messages(payload, image_list, session):
     if payload.include_history:
         # fetch history in ascending order by start_ts
         
-        llm_history = await functions.load_history(payload.case_id, payload.user_id, payload.include_user, session)
+        with metrics.timed("query", "context_load"):
+            async with AsyncSessionMaker() as session:
+                llm_history = await functions.load_history(payload.case_id, payload.user_id, payload.include_user, session)
 
         # Determine if we need to summarize the history
         turn_lengths = [len(item.prompt) + len(item.response) for item in llm_history]
@@ -81,11 +90,14 @@ async def construct_messages(payload, image_list, session):
 
         # summarize bits of history that meet the criteria
         if len(to_summarize) > 0:
-            summary = await summarise_history(to_summarize)
+            with metrics.timed("query", "history_summary"):
+                summary = await summarise_history(to_summarize)
             try:
-                await functions.clear_selected_history(payload.case_id, payload.user_id, [i for i in range(len(to_summarize))], session, summary)
-            except Exception as e:
-                print(f"Error clearing LLM history and putting in summary: {e}")
+                with metrics.timed("query", "persist"):
+                    async with AsyncSessionMaker() as session:
+                        await functions.clear_selected_history(payload.case_id, payload.user_id, [item.id for item in to_summarize], session, summary)
+            except Exception:
+                log.exception("Error clearing LLM history and putting in summary")
             messages.append({"role": "assistant", "content": f'The following is a summary of the conversation history: {summary}'})
 
         for item in llm_history[last_index:]:
@@ -105,25 +117,26 @@ async def summarise_history(selected_llm_hist: list) -> str:
     llm_hist = "\n\n".join(
         [f"Prompt: {item.prompt}\nResponse: {item.response}" for item in selected_llm_hist]
     )
-    resp = await client.chat.completions.create(
-        model="gpt-4.1-mini",
+    resp = await llm_providers.router.chat(
+        "history_summary",
         messages=[
             {"role":"system","content":"Return summary of prior chat history, concise yet thorough, about 400 words max. No extra information, just the summary."},
             {"role":"user","content": llm_hist}
         ],
         max_completion_tokens=1000  
     )
+    metrics.record_usage("history_summary", resp.usage)
     return resp.choices[0].message.content
 
 async def query_llm(msgs_imgs, effort, max_tokens):
     try:
-        response = await client.chat.completions.create(
-            model="gpt-4.1-mini",
+        response = await llm_providers.router.chat(
+            "query",
             messages= msgs_imgs,
             max_completion_tokens= min(max(max_tokens, 1000), 10000) 
         )
         return response
 
     except Exception as e:
-        print(f"Error querying LLM: {e}")
+        log.error("Error querying LLM: %s", e)
         return "OpenAI API error: " + str(e)
\ No newline at end of file
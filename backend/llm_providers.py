@@ -0,0 +1,195 @@
+import os
+import json
+import time
+import random
+import logging
+from collections import OrderedDict
+import openai
+import dotenv
+import metrics
+
+dotenv.load_dotenv()
+log = logging.getLogger(__name__)
+
+# unset: one provider, OpenAI itself (or whatever OPENAI_BASE_URL points at) with LLM_MODEL for every role.
+# otherwise a JSON list, or the path of a JSON file holding one, tried in order as a fallback chain:
+#   [{"name": "lan", "base_url": "http://10.0.0.5:8000/v1", "api_key_env": "LAN_LLM_KEY",
+#     "models": {"default": "qwen2.5-vl-32b-instruct", "docs": "llama-3.3-70b-instruct"},
+#     "vision": true, "files": false, "streaming": true, "timeout": 120},
+#    {"name": "openai", "models": {"default": "gpt-4.1-mini"}}]
+# roles: "query" (image Q&A), "history_summary", "docs"; "default" covers the ones not listed.
+LLM_PROVIDERS = os.getenv("LLM_PROVIDERS", "")
+LLM_MODEL = os.getenv("LLM_MODEL", "gpt-4.1-mini")
+LLM_ROUTING = os.getenv("LLM_ROUTING", "order")             # "order", or "latency": fastest healthy provider first
+LLM_COOLDOWN = float(os.getenv("LLM_COOLDOWN", "30"))       # seconds a failing provider goes to the back of the chain
+LLM_LATENCY_ALPHA = float(os.getenv("LLM_LATENCY_ALPHA", "0.2"))   # EWMA weight of the newest call
+LLM_EXPLORE = float(os.getenv("LLM_EXPLORE", "0.05"))       # share of calls that re-measure a slower provider
+
+# worth trying the next provider for; a bad request would fail the same way everywhere
+FALLBACK_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, openai.NotFoundError)
+
+
+class NoProviderError(RuntimeError):
+    pass
+
+
+class Provider:
+    """One OpenAI-compatible endpoint, its model per role and what it can take."""
+
+    def __init__(self, name: str, base_url: str | None = None, api_key_env: str | None = None,
+                 models: dict | None = None, vision: bool = True, files: bool = True, streaming: bool = True,
+                 timeout: float = 600, max_retries: int = 1, client=None):
+        self.name = name
+        self.base_url = base_url
+        self.models = models or {"default": LLM_MODEL}
+        self.vision, self.files, self.streaming = vision, files, streaming
+        if client is None:
+            if api_key_env:
+                api_key = os.getenv(api_key_env)
+            elif base_url is None:
+                api_key = None          # the SDK reads OPENAI_API_KEY
+            else:
+                api_key = "none"        # never hand the OpenAI key to some other server
+            client = openai.AsyncOpenAI(base_url=base_url, api_key=api_key, timeout=timeout, max_retries=max_retries)
+        self.client = client
+        self.failed_until = 0.0
+        self.latency: dict[tuple[str, bool], float] = {}    # (role, streamed) -> EWMA seconds
+
+    def model_for(self, role: str) -> str | None:
+        return self.models.get(role) or self.models.get("default")
+
+    def supports(self, needs: set) -> bool:
+        return all(getattr(self, need) for need in needs)
+
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.failed_until
+
+
+class Router:
+    """Sends each call to the first provider that can take it, moving on when one is down."""
+
+    def __init__(self, providers: list[Provider], routing: str = LLM_ROUTING, cooldown: float = LLM_COOLDOWN,
+                 alpha: float = LLM_LATENCY_ALPHA, explore: float = LLM_EXPLORE):
+        if not providers:
+            raise ValueError("at least one LLM provider is needed")
+        self.providers = providers
+        self.routing, self.cooldown, self.alpha, self.explore = routing, cooldown, alpha, explore
+        # uploaded file ids only exist on the provider that took the upload
+        self._file_owner: OrderedDict[str, Provider] = OrderedDict()
+
+    def candidates(self, role: str, needs: set = frozenset(), pinned: Provider | None = None,
+                   streamed: bool = False) -> list[Provider]:
+        able = [p for p in self.providers if p.model_for(role) and p.supports(needs)]
+        if pinned is not None:
+            able = [p for p in able if p is pinned]
+        healthy = [p for p in able if p.healthy()]
+        if self.routing == "latency" and len(healthy) > 1:
+            # unmeasured providers sort first, so each one gets measured
+            healthy.sort(key=lambda p: p.latency.get((role, streamed), 0.0))
+            if random.random() < self.explore:
+                healthy.insert(0, healthy.pop(random.randrange(1, len(healthy))))
+        # cooling down ones stay as a last resort
+        return healthy + [p for p in able if not p.healthy()]
+
+    def can(self, role: str, capability: str) -> bool:
+        return bool(self.candidates(role, {capability}))
+
+    async def chat(self, role: str, messages: list, stream: bool = False, **kwargs):
+        """chat.completions.create on the first provider that answers. Streams only fall
+        back while opening, once chunks flow an error goes to the caller."""
+        needs = _needs(messages)
+        if stream:
+            needs.add("streaming")
+        pinned = self._pinned(messages)
+        _, response = await self._call(role, self.candidates(role, needs, pinned, stream), stream, needs,
+                                       lambda p: p.client.chat.completions.create(
+                                           model=p.model_for(role), messages=messages, stream=stream, **kwargs))
+        return response
+
+    async def upload_file(self, role: str, path: str, purpose: str) -> str:
+        """files.create on a provider with a Files API; the id pins later calls using it."""
+        async def upload(provider):
+            with open(path, "rb") as f:         # reopened per attempt, a failed one may have read it
+                return await provider.client.files.create(file=f, purpose=purpose)
+
+        provider, file_ref = await self._call(role, self.candidates(role, {"files"}), False, {"files"},
+                                              upload, measure=False)
+        self._file_owner[file_ref.id] = provider
+        if len(self._file_owner) > 10_000:
+            self._file_owner.popitem(last=False)
+        return file_ref.id
+
+    async def _call(self, role, providers, streamed, needs, make_call, measure=True):
+        if not providers:
+            raise NoProviderError(f"no LLM provider for {role!r} supports {', '.join(sorted(needs)) or 'it'}")
+        last_error = None
+        for provider in providers:
+            start = time.perf_counter()
+            try:
+                result = await make_call(provider)
+            except FALLBACK_ERRORS as e:
+                provider.failed_until = time.monotonic() + self.cooldown
+                metrics.llm_provider_calls.inc(provider.name, role, "fallback")
+                log.warning("LLM provider %s failed for %s (%s: %s), trying the next one",
+                            provider.name, role, type(e).__name__, e)
+                last_error = e
+                continue
+            except Exception:
+                metrics.llm_provider_calls.inc(provider.name, role, "error")
+                raise
+            if measure:
+                self._observe(provider, role, streamed, time.perf_counter() - start)
+            provider.failed_until = 0.0
+            metrics.llm_provider_calls.inc(provider.name, role, "ok")
+            return provider, result
+        raise last_error
+
+    def _observe(self, provider, role, streamed, seconds):
+        key = (role, streamed)
+        previous = provider.latency.get(key)
+        provider.latency[key] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def _pinned(self, messages) -> Provider | None:
+        for file_id in _file_ids(messages):
+            owner = self._file_owner.get(file_id)
+            if owner is not None:
+                return owner
+        return None
+
+
+def _parts(messages):
+    for m in messages:
+        if isinstance(m.get("content"), list):
+            yield from m["content"]
+
+
+def _needs(messages) -> set:
+    needs = set()
+    for part in _parts(messages):
+        if part.get("type") == "image_url":
+            needs.add("vision")
+        elif part.get("type") == "file":
+            needs.add("files")
+    return needs
+
+
+def _file_ids(messages):
+    for part in _parts(messages):
+        if part.get("type") == "file" and part["file"].get("file_id"):
+            yield part["file"]["file_id"]
+
+
+def load_providers(spec: str = LLM_PROVIDERS) -> list[Provider]:
+    if not spec.strip():
+        return [Provider("openai")]
+    if not spec.lstrip().startswith("["):
+        with open(spec, encoding="utf-8") as f:
+            spec = f.read()
+    return [Provider(**entry) for entry in json.loads(spec)]
+
+
+router = Router(load_providers())
+metrics.Gauge("llm_provider_latency_seconds", "Smoothed upstream latency per provider and role.",
+              lambda: {(p.name, role, str(streamed).lower()): v
+                       for p in router.providers for (role, streamed), v in p.latency.items()},
+              ("provider", "role", "streamed"))
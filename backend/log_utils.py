@@ -0,0 +1,85 @@
+import os
+import atexit
+import queue
+import random
+import logging
+import logging.handlers
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FIELD_MAX = int(os.getenv("LOG_FIELD_MAX", "300"))         # chars kept per string field
+LOG_ITEMS_MAX = int(os.getenv("LOG_ITEMS_MAX", "20"))          # items kept per list
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "1.0"))   # share of payload logs written
+
+_listener = None
+
+
+def setup_logging(level: str = LOG_LEVEL, stream=None):
+    """Root logger writing through a queue, the actual stream write happens on a
+    background thread so a slow stdout never stalls the event loop."""
+    global _listener
+    if _listener is not None:
+        return
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.SimpleQueue()
+    root = logging.getLogger()
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+    root.setLevel(level)
+    _listener = logging.handlers.QueueListener(log_queue, handler)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()     # drains the queue
+    for handler in [h for h in logging.getLogger().handlers if isinstance(h, logging.handlers.QueueHandler)]:
+        logging.getLogger().removeHandler(handler)
+    _listener = None
+
+
+def redact(value, limit: int = LOG_FIELD_MAX):
+    """Copy of `value` that is safe to log: data URLs and bytes are replaced by
+    their size, long strings and lists are cut down."""
+    if hasattr(value, "model_dump"):
+        value = value.model_dump()
+    if isinstance(value, str):
+        if value.startswith("data:"):
+            return f"<{value[5:value.find(';')]} {len(value)} chars>"
+        if len(value) > limit:
+            return f"{value[:limit]}... (+{len(value) - limit} chars)"
+        return value
+    if isinstance(value, (bytes, bytearray)):
+        return f"<{len(value)} bytes>"
+    if isinstance(value, dict):
+        return {k: redact(v, limit) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        items = [redact(v, limit) for v in value[:LOG_ITEMS_MAX]]
+        if len(value) > LOG_ITEMS_MAX:
+            items.append(f"... (+{len(value) - LOG_ITEMS_MAX} items)")
+        return items
+    return value
+
+
+class Redacted:
+    """Log argument that only redacts and formats when the record is emitted."""
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return str(redact(self.value))
+
+
+def log_payload(logger: logging.Logger, msg: str, value, rate: float | None = None):
+    """Debug-level dump of a payload or response, redacted and sampled at
+    LOG_SAMPLE_RATE. Costs one level check when debug logging is off."""
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    rate = LOG_SAMPLE_RATE if rate is None else rate
+    if rate < 1 and random.random() >= rate:
+        return
+    logger.debug("%s: %s", msg, Redacted(value))
@@ -1,19 +1,43 @@
-from fastapi import FastAPI, Depends, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, Depends, Request, Response, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
+from typing import Any
 import asyncio
+import logging
+import caching
+from compression import CompressionMiddleware
 import functions
+from case_events import hub
 import llm_from_docs
 import llm_processing
+import metrics
 import pydantic_models as models
-from sqlalchemy import select
-from db.models import Case, Image, LLMHistory, User
-from db.session import get_session
-import json
+import profiling
+from singleflight import SingleFlight, request_key
+from db.session import get_session, pool_status, AsyncSessionMaker
+from log_utils import setup_logging, log_payload
 from uuid import uuid4
 
+setup_logging()
+log = logging.getLogger(__name__)
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # cross-worker cache invalidation, off unless CACHE_NOTIFIER is set
+    await caching.start_notifier()
+    # keeps case_changes (the delta sync log) to SYNC_RETENTION_DAYS
+    pruner = asyncio.create_task(functions.prune_case_changes_forever()) if functions.SYNC_RETENTION_DAYS > 0 else None
+    yield
+    if pruner:
+        pruner.cancel()
+    await caching.stop_notifier()
+
+
+# orjson renders the response models, much faster than the stdlib encoder
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -21,130 +45,216 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Profile-Path"],    # read by the delta sync client / profiling users
 )
+# per-request profiling for admins, not installed at all unless PROFILE_TOKEN is set
+if profiling.PROFILE_TOKEN:
+    app.add_middleware(profiling.ProfilingMiddleware)
+# br / gzip for JSON and text above COMPRESS_MIN_BYTES, images and PDFs are left alone
+app.add_middleware(CompressionMiddleware)
+# outermost, so route latency includes compression
+app.add_middleware(metrics.MetricsMiddleware)
 
 app.mount("/images", StaticFiles(directory="storage/images"), name="images")
 app.mount("/clinical", StaticFiles(directory="storage/clinical"), name="clinical")
 
 
 tasks: dict[str, asyncio.Task] = {}
+task_keys: dict[str, str] = {}      # request_key of each user's running query
 task_lock = asyncio.Lock()
+# identical LLM requests in flight at once (double clicks, several viewers) share one upstream call
+query_flights = SingleFlight("query")
+docs_flights = SingleFlight("docs")
 
 connections: list[dict] = []
 
+metrics.Gauge("ws_connections", "Open /ws connections.", lambda: {(): len(connections)})
+metrics.Gauge("llm_tasks_active", "LLM queries in flight.", lambda: {(): len(tasks)})
+metrics.Gauge("llm_flights_active", "Distinct upstream LLM requests in flight.",
+              lambda: {(flights.name,): len(flights) for flights in (query_flights, docs_flights)}, ("flight",))
+metrics.Gauge("db_pool", "Connection pool state, see /db/pool-status.",
+              lambda: {(key,): value for key, value in pool_status().items()}, ("stat",))
+metrics.Gauge("cache_lookups", "Cache hits and misses since start.",
+              lambda: {(cache.name, outcome): getattr(cache, outcome)
+                       for cache in (caching.clinical_cache, caching.settings_cache)
+                       for outcome in ("hits", "misses")}, ("cache", "outcome"))
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     client_id = str(uuid4())
-    print(f"Client {client_id} connected")
+    log.info("Client %s connected", client_id)
     connections.append({ 'id': client_id, 'ws': websocket })
     await websocket.send_json({"type": "id", "id": client_id})
+    metrics.ws_messages.inc("out", "id")
     try:
         while True:
             data = await websocket.receive_json()
+            # case event subscriptions are for the server, not relayed to peers
+            if data.get("type") == "subscribe":
+                metrics.ws_messages.inc("in", "subscribe")
+                if data.get("case_id"):
+                    hub.subscribe(websocket, data["case_id"])
+                continue
+            if data.get("type") == "unsubscribe":
+                metrics.ws_messages.inc("in", "unsubscribe")
+                hub.unsubscribe(websocket)
+                continue
+            metrics.ws_messages.inc("in", "relay")
             target = data.get("target")
             if target:
                 # data_dict = {key: val for key, val in data.items() if key != 'data'}
                 # print( f"Message from {client_id} to target {data_dict}")
                 for conn in connections:
                     if conn['id'] == target:
-                        await conn['ws'].send_json(data)
+                        await relay(conn, data)
                         break
             else:
                 # data_dict = {key: val for key, val in data.items() if key != 'data'}
                 # print(f"Message from {client_id} (broadcast): {data_dict})")
                 # Broadcast to all connections if no target is specified
-                for conn in connections:
+                for conn in list(connections):
                     if conn['ws'] != websocket:
-                        await conn['ws'].send_json(data)
+                        await relay(conn, data)
     except WebSocketDisconnect:
-        print(f"Client {client_id} disconnected")
+        log.info("Client %s disconnected", client_id)
+    finally:
+        # also on errors, a dead socket left in the list breaks every later relay
         connections[:] = [conn for conn in connections if conn['ws'] != websocket]
+        hub.unsubscribe(websocket)
+
+
+async def relay(conn, data):
+    # a peer that went away without a clean close only drops itself, not the sender
+    try:
+        await conn['ws'].send_json(data)
+        metrics.ws_messages.inc("out", "relay")
+    except Exception as e:
+        log.info("Dropping client %s: %s", conn['id'], e)
+        connections[:] = [c for c in connections if c is not conn]
+        hub.unsubscribe(conn['ws'])
+
+
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 
-@app.post("/capture-image")
+@app.get("/db/pool-status", response_model=models.PoolStatus)
+async def db_pool_status():
+    return pool_status()
+
+
+@app.post("/capture-image", response_model=models.CaptureImageResponse)
 async def capture_image(payload: models.ImagePayload, session = Depends(get_session)):
-    print(f"Capturing image for case_id: {payload.case_id}")
+    log.debug("Capturing image for case_id: %s", payload.case_id)
     _ = await functions.check_create_case(payload.case_id, payload.user_id, session)
 
     image_path = await functions.image_capture(payload, session)
 
-    print(f"Image saved to {image_path}")
+    log.info("Image saved to %s", image_path)
     return {"status": "success", "image_path": image_path}
 
-@app.post("/get-images")
+@app.post("/get-images", response_model=models.ImagesResponse)
 async def get_images(payload: models.GetImagesPayload, session = Depends(get_session)):
-    print(f"Fetching images for case_id: {payload.case_id}")
-    if not payload.user_id:
-        stmt = select(Image).where(Image.case_id == payload.case_id).order_by(Image.uploaded)
-    else:
-        stmt = select(Image).where(Image.case_id == payload.case_id, Image.user_id == payload.user_id).order_by(Image.uploaded)
-    images = (await session.scalars(stmt)).all()
-
-    image_list = [{"filename": img.filename, "url": img.rel_path} for img in images]
-    return {"images": image_list, "count": len(image_list)}
-
-
-@app.post("/get-latest-case")
+    log.debug("Fetching images for case_id: %s", payload.case_id)
+    image_list, next_cursor = await functions.list_images_page(
+        payload.case_id, payload.user_id, payload.cursor, payload.limit, session)
+    return {"images": image_list, "count": len(image_list), "next_cursor": next_cursor}
+
+
+@app.get("/cases/{case_id}/snapshot", response_model=models.CaseSnapshot)
+async def case_snapshot(case_id: str, images_user_id: str | None = None,
+                        history_user_id: str | None = None, limit: int | None = None):
+    # images, history, clinical data and docs in one round trip for opening a case
+    log.debug("Fetching snapshot for case_id: %s", case_id)
+    return await functions.get_case_snapshot(case_id, images_user_id, history_user_id, limit)
+
+
+@app.get("/cases/{case_id}/images", response_model=models.ImagesDelta)
+async def case_images_delta(case_id: str, request: Request, since: int | None = None,
+                            user_id: str | None = None, session = Depends(get_session)):
+    return await _delta_response("images", case_id, user_id, since, request, session)
+
+@app.get("/cases/{case_id}/history", response_model=models.HistoryDelta)
+async def case_history_delta(case_id: str, request: Request, since: int | None = None,
+                             user_id: str | None = None, session = Depends(get_session)):
+    return await _delta_response("history", case_id, user_id, since, request, session)
+
+async def _delta_response(kind, case_id, user_id, since, request, session):
+    # the change log state alone decides the ETag, so an unchanged list costs one index lookup
+    cursor, count = await functions.change_state(case_id, kind, session)
+    etag = f'W/"{kind}-{cursor}-{count}-{user_id or "all"}-{"full" if since is None else since}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    body = await functions.case_items_delta(kind, case_id, user_id, since, session)
+    body["cursor"] = cursor
+    return ORJSONResponse(body, headers={"ETag": etag})
+
+
+@app.post("/get-latest-case", response_model=models.CaseIdResponse)
 async def get_latest_case(session = Depends(get_session)):
-    print("Fetching latest case ID")
     case_id = await functions.find_latest_case(session)
-    print(f"Latest case ID: {case_id}")
+    log.debug("Latest case ID: %s", case_id)
     return {"case_id": case_id}
 
 
-@app.post("/delete-images")
+@app.post("/delete-images", response_model=models.DeleteImagesResponse, response_model_exclude_none=True)
 async def delete_images_endpoint(payload: models.DeleteImagesPayload, session = Depends(get_session)):
     # Delete selected images
 
     image_list, count = await functions.delete_images(payload, session)
-    print(f"Deleted images, new list: {image_list}, count: {count}")
+    if image_list is None:
+        return {"status": "deleted"}
+    log.info("Deleted images for case_id: %s, %d left", payload.case_id, count)
     return {"images": image_list, "count": count}
 
-@app.post("/list-cases")
+@app.post("/list-cases", response_model=models.CasesResponse)
 async def list_cases(payload: models.User, session = Depends(get_session)):
     user_id = payload.user_id
-    if user_id is None:
-        print("Listing all cases")
-        stmt = select(Case).order_by(Case.updated.desc())
-    else:
-        print(f"Listing cases for user_id: {user_id}")
-        stmt = (
-            select(Case)
-            .where(Case.user_id == user_id)
-            .order_by(Case.updated.desc())
-        )
-    cases = (await session.scalars(stmt)).all()
-    return {"cases": [case.case_id for case in cases]}
-
-@app.post("/create-new-case")
+    log.debug("Listing cases for user_id: %s", user_id or "all")
+    case_ids, next_cursor = await functions.list_cases_page(user_id, payload.cursor, payload.limit, session)
+    return {"cases": case_ids, "next_cursor": next_cursor}
+
+@app.post("/create-new-case", response_model=models.CaseIdResponse)
 async def create_new_case(session = Depends(get_session)):
     case_id = await functions.create_new_case_number(session=session)
     return {"case_id": case_id}
 
-@app.post("/query-llm")
-async def query_llm(payload: models.QueryLLMPayload, session = Depends(get_session)):
-    _ = await functions.check_create_case(payload.case_id, payload.user_id, session)
+@app.post("/query-llm", response_model=models.QueryLLMResponse)
+async def query_llm(payload: models.QueryLLMPayload):
+    # no request-wide session here, it would sit idle for the whole upstream call
+    async with AsyncSessionMaker() as session:
+        _ = await functions.check_create_case(payload.case_id, payload.user_id, session)
     user_id = payload.user_id
+    # the user's own history only matters with include_user, otherwise anyone's identical query matches
+    key = request_key(payload.model_dump(exclude=set() if payload.include_history and payload.include_user
+                                         else {"user_id"}))
     async with task_lock:
         old_task = tasks.get(user_id)
-        if old_task and not old_task.done():
-            old_task.cancel()
-        
-        new_task = asyncio.create_task(llm_processing.main(payload, session))
-        tasks[user_id] = new_task
+        if old_task and not old_task.done() and task_keys.get(user_id) == key:
+            # the same query again (a double click): wait for the running one instead of restarting it
+            new_task = old_task
+        else:
+            if old_task and not old_task.done():
+                old_task.cancel()
+            # cancelling this task drops only this user's wait, the shared call runs on for the others
+            new_task = asyncio.create_task(query_flights.do(key, lambda: llm_processing.main(payload)))
+            tasks[user_id], task_keys[user_id] = new_task, key
     try:
         response = await new_task
-        print(f"LLM response: {response}")
+        log_payload(log, "LLM response", response)
         return {"response": response}
     except asyncio.CancelledError:
-        print(f"LLM query for user {user_id} was cancelled.")
+        log.info("LLM query for user %s was cancelled.", user_id)
         return {"response": "Query cancelled."}
     finally:
         async with task_lock:
-            tasks.pop(user_id, None)
+            # a newer query may have taken the slot already
+            if tasks.get(user_id) is new_task:
+                del tasks[user_id], task_keys[user_id]
     
-@app.post("/cancel-llm-query")
+@app.post("/cancel-llm-query", response_model=models.StatusResponse, response_model_exclude_none=True)
 async def cancel_llm(payload: models.CancelLLMPayload):
     user_id = payload.user_id
     async with task_lock:
@@ -154,92 +264,81 @@ async def cancel_llm(payload: models.CancelLLMPayload):
             return {"status": "cancelled", "message": f"LLM query for user {user_id} cancelled."}
     return {"status": "no active query found"}
 
-@app.get("/user-settings/{user_id}")
+@app.get("/user-settings/{user_id}", response_model=models.UserSettingsResponse)
 async def get_user_settings(user_id: str, session = Depends(get_session)):
-    print(f"Loading user settings for user_id: {user_id}")
-    stmt = select(User).where(User.user_id == user_id)
-    users = (await session.scalars(stmt)).all()
-    settings = users[0].settings if users else {}
-    print(f"User settings for {user_id}: {settings}")
+    settings = await functions.get_user_settings(user_id, session)
+    log_payload(log, f"User settings for {user_id}", settings)
     return {"settings": settings}
 
-@app.post("/user-settings/{user_id}")
+@app.post("/user-settings/{user_id}", response_model=models.StatusResponse, response_model_exclude_none=True)
 async def save_user_settings(user_id: str, settings: dict, session = Depends(get_session)):
-    stmt = select(User).where(User.user_id == user_id)
-    users = (await session.scalars(stmt)).all()
-    if not users:
-        print(f"No users found for user_id: {user_id}, creating a new user.")
-        user = User(user_id=user_id, settings=settings)
-        session.add(user)
-    else:
-        user = users[0]
-        user.settings = settings
-    await session.commit()
+    await functions.save_user_settings(user_id, settings, session)
     return {"status": "success"}
 
-@app.post("/append-llm-history")
+@app.post("/append-llm-history", response_model=models.StatusResponse)
 async def append_llm_history(payload: models.AppendLLMHistoryPayload, session = Depends(get_session)):
-    print(f"Appending LLM history for case_id: {payload.case_id} with prompt: {payload.prompt}")
-    print(f"payload: {payload}")
-    new_entry = LLMHistory(
-        case_id=payload.case_id,
-        user_id=payload.user_id,
-        prompt=payload.prompt,
-        image_count=payload.image_count,
-        response=payload.response)
-    session.add(new_entry)
-    await session.commit()
+    log.info("Appending LLM history for case_id: %s", payload.case_id)
+    log_payload(log, "Append history payload", payload)
+    await functions.append_history(payload.case_id, payload.user_id, payload.prompt,
+                                   payload.response, payload.image_count, session)
     return {"status": "success", "message": "LLM history entry added."}
 
-@app.post("/llm-history")
+@app.post("/llm-history", response_model=models.HistoryResponse)
 async def get_llm_history(payload: models.GetLLMHistoryPayload, session = Depends(get_session)):
-    if payload.user_id:
-        history = await functions.load_history(payload.case_id, payload.user_id, True, session)
-    else:
-        history = await functions.load_history(payload.case_id, None, False, session)
-    return {"history": history}
+    history, next_cursor = await functions.list_history_page(
+        payload.case_id, payload.user_id, payload.cursor, payload.limit, session)
+    return {"history": history, "next_cursor": next_cursor}
 
-@app.post("/clear-llm-history")
+@app.post("/clear-llm-history", response_model=models.StatusResponse, response_model_exclude_none=True)
 async def delete_llm_history(payload: models.DeleteLLMHistoryPayload, session = Depends(get_session)):
-    print(f"Clearing LLM history for case_id: {payload.case_id} with selected entries: {payload.selected_history}")
-    await functions.clear_selected_history(payload.case_id, payload.user_id, payload.selected_history, session)
+    log.info("Clearing LLM history for case_id: %s, entries: %s", payload.case_id, payload.entry_ids)
+    await functions.clear_selected_history(payload.case_id, payload.user_id, payload.entry_ids, session)
     return {"status": "cleared"}
 
-@app.post("/clinical-data/get")
+@app.post("/clinical-data/get", response_model=models.ClinicalResponse)
 async def api_get_clinical(payload: models.CaseId, session=Depends(get_session)):
-    print(f"Fetching clinical data for case_id: {payload.case_id}")
+    log.debug("Fetching clinical data for case_id: %s", payload.case_id)
     data  = await functions.get_clinical_data(payload.case_id, session)
     return {"clinical": data}
 
-@app.post("/clinical-data/update")
+@app.post("/clinical-data/update", response_model=models.ClinicalResponse)
 async def api_update_clinical(payload: models.ClinicalFieldsUpdate, session=Depends(get_session)):
     data = await functions.update_clinical_fields(payload.case_id, payload.fields, session)
     return {"clinical": data}
 
-@app.post("/clinical-docs/retrieve")
+@app.post("/clinical-docs/retrieve", response_model=models.DocsResponse)
 async def api_docs_retrieve(payload: models.CaseId, session=Depends(get_session)):
     docs = await functions.list_clinical_documents(payload.case_id, session)
-    print(f"Retrieved docs: {docs}")
+    log_payload(log, "Retrieved docs", docs)
     return {"count": len(docs), "docs": docs}
 
-@app.post("/clinical-docs/upload")
+@app.post("/clinical-docs/upload", response_model=models.DocUploadResponse)
 async def api_docs_upload(payload: models.ClinicalDocUpload, session=Depends(get_session)):
+    _ = await functions.check_create_case(payload.case_id, payload.user_id, session)
     return await functions.save_clinical_document(
         payload.case_id, payload.user_id,
         payload.filename, payload.file_data, session
     )
 
-@app.post("/clinical-docs/delete")
+@app.post("/clinical-docs/delete", response_model=models.DocsResponse)
 async def api_docs_delete(payload: models.ClinicalDocsDelete, session=Depends(get_session)):
     docs = await functions.delete_clinical_documents(payload.case_id, payload.urls, session)
     return {"count": len(docs), "docs": docs}
 
-@app.post("/clinical-docs/llm-query")
-async def api_docs_llm_query(payload: models.ClinicalDocsLLMQuery, session=Depends(get_session)):
-    print(f"Processing clinical documents LLM query for case_id: {payload.case_id} with selected indices: {payload.selected}")
-    raw_response = await llm_from_docs.main(payload.case_id, payload.user_id, payload.selected, payload.specimen,session)
-    print(f"LLM response: {raw_response}")
-    cleaned_response = raw_response.strip().removeprefix("```json").removesuffix("```")
-    return json.loads(cleaned_response)
-
-
+@app.post("/clinical-docs/llm-query", response_model=dict[str, Any])
+async def api_docs_llm_query(payload: models.ClinicalDocsLLMQuery):
+    log.info("Clinical documents LLM query for case_id: %s, fields: %s (mode: %s)", payload.case_id, payload.selected, payload.mode)
+    key = request_key(payload.model_dump(exclude={"user_id"}))
+    return await docs_flights.do(key, lambda: llm_from_docs.main(
+        payload.case_id, payload.user_id, payload.selected, payload.specimen, payload.mode))
+
+@app.post("/clinical-docs/llm-query/stream")
+async def api_docs_llm_query_stream(payload: models.ClinicalDocsLLMQuery):
+    log.info("Streaming clinical documents LLM query for case_id: %s, fields: %s (mode: %s)", payload.case_id, payload.selected, payload.mode)
+    # load docs up front, nothing holds a connection while the answer streams
+    async with AsyncSessionMaker() as session:
+        docs = await llm_from_docs.list_clinical_documents(payload.case_id, session)
+    return StreamingResponse(
+        llm_from_docs.stream_fields(payload.selected, payload.specimen, docs, payload.case_id, payload.mode),
+        media_type="application/x-ndjson",
+    )
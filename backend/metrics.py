@@ -0,0 +1,162 @@
+import time
+import bisect
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)   # seconds
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_registry: list = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name, self.help, self.labels = name, help, labels
+        self.values: dict[tuple, float] = {}
+        _registry.append(self)
+
+    def inc(self, *labels, amount: float = 1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for labels, value in self.values.items():
+            yield f"{self.name}{_format_labels(self.labels, labels)} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name, self.help, self.labels, self.buckets = name, help, labels, buckets
+        self.series: dict[tuple, list] = {}     # labels -> [bucket counts (+Inf last), sum, count]
+        _registry.append(self)
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        names = self.labels + ("le",)
+        for labels, (counts, total, count) in self.series.items():
+            cumulative = 0
+            for bound, n in zip(self.buckets + ("+Inf",), counts):
+                cumulative += n
+                yield f"{self.name}_bucket{_format_labels(names, labels + (bound,))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, labels)} {total}"
+            yield f"{self.name}_count{_format_labels(self.labels, labels)} {count}"
+
+
+class Gauge:
+    """Read at scrape time from `read()`, which returns {label values: value}."""
+
+    def __init__(self, name: str, help: str, read, labels: tuple = ()):
+        self.name, self.help, self.read, self.labels = name, help, read, labels
+        _registry.append(self)
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        for labels, value in self.read().items():
+            yield f"{self.name}{_format_labels(self.labels, labels)} {value}"
+
+
+def render() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return "\n".join(line for metric in _registry for line in metric.render()) + "\n"
+
+
+# ─────────────────────── instruments ───────────────────────
+request_seconds = Histogram("http_request_duration_seconds", "Request latency by route, until the last body byte.",
+                            ("method", "route", "status"))
+request_queries = Histogram("http_request_db_queries", "Database queries issued per request.",
+                            ("route",), COUNT_BUCKETS)
+db_queries = Counter("db_queries_total", "Database queries issued, inside requests or not.")
+llm_phase_seconds = Histogram("llm_phase_duration_seconds", "Time spent in each phase of the LLM flows.",
+                              ("flow", "phase"))
+llm_tokens = Counter("llm_tokens_total", "Tokens reported in response.usage.", ("flow", "kind"))
+llm_provider_calls = Counter("llm_provider_calls_total", "Upstream LLM calls by provider, role and outcome.",
+                             ("provider", "role", "outcome"))
+singleflight_calls = Counter("llm_singleflight_calls_total",
+                             "LLM requests that started an upstream call (leader) or joined one in flight (follower).",
+                             ("flight", "role"))
+ws_messages = Counter("ws_messages_total", "WebSocket messages by direction and type.", ("direction", "type"))
+
+_current_queries: ContextVar[list | None] = ContextVar("current_queries", default=None)
+
+
+def record_query():
+    db_queries.inc()
+    queries = _current_queries.get()
+    if queries is not None:
+        queries[0] += 1
+
+
+@contextmanager
+def timed(flow: str, phase: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        llm_phase_seconds.observe(time.perf_counter() - start, flow, phase)
+
+
+def record_usage(flow: str, usage):
+    if usage is None:
+        return
+    llm_tokens.inc(flow, "prompt", amount=usage.prompt_tokens or 0)
+    llm_tokens.inc(flow, "completion", amount=usage.completion_tokens or 0)
+
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return route.path                            # the template, keeps label cardinality bounded
+    if scope.get("root_path"):
+        return scope["root_path"] + "/{path}"       # static mounts
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Records latency and query count for every HTTP request."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+        queries = [0]
+        token = _current_queries.set(queries)
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current_queries.reset(token)
+            route = _route_label(scope)
+            request_seconds.observe(time.perf_counter() - start, scope["method"], route, status)
+            request_queries.observe(queries[0], route)
@@ -16,10 +16,17 @@ load_dotenv()
 config = context.config
 
 db_url = os.getenv("DATABASE_URL")
+if not db_url and os.getenv("ASYNC_DATABASE_URL"):
+    # migrations run on a sync driver, derive it from the app's async URL
+    db_url = (os.environ["ASYNC_DATABASE_URL"]
+              .replace("+aiosqlite", "")
+              .replace("+asyncpg", "+psycopg2"))
 if not db_url:
     raise RuntimeError(
         "DATABASE_URL is not set - see your .env or shell env vars."
     )
+# sqlite has next to no ALTER TABLE, batch ops copy the table instead
+render_as_batch = db_url.startswith("sqlite")
 config.set_main_option("sqlalchemy.url", db_url)
 
 # Interpret the config file for Python logging.
@@ -57,6 +64,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        render_as_batch=render_as_batch,
     )
 
     with context.begin_transaction():
@@ -78,7 +86,8 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection, target_metadata=target_metadata,
+            render_as_batch=render_as_batch,
         )
 
         with context.begin_transaction():
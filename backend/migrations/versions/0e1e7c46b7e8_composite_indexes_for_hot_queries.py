@@ -0,0 +1,48 @@
+"""composite indexes for hot queries
+
+Revision ID: 0e1e7c46b7e8
+Revises: 696bf11e1e69
+Create Date: 2025-07-19 15:12:50.871406
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0e1e7c46b7e8'
+down_revision: Union[str, Sequence[str], None] = '696bf11e1e69'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # built concurrently so a large images table isn't write-locked while indexing
+    with op.get_context().autocommit_block():
+        op.create_index('ix_cases_user_id_updated', 'cases', ['user_id', 'updated'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_cases_updated', 'cases', ['updated'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_cases_case_id_pattern', 'cases', ['case_id'], unique=False, postgresql_ops={'case_id': 'text_pattern_ops'}, postgresql_concurrently=True)
+        op.create_index('ix_images_case_id_uploaded', 'images', ['case_id', 'uploaded'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_images_case_id_user_id_uploaded', 'images', ['case_id', 'user_id', 'uploaded'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_llm_history_case_id_start_ts', 'llm_history', ['case_id', 'start_ts'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_llm_history_case_id_user_id_start_ts', 'llm_history', ['case_id', 'user_id', 'start_ts'], unique=False, postgresql_concurrently=True)
+        # the (case_id, …) composites above cover plain case_id lookups
+        op.drop_index('ix_images_case_id', table_name='images', postgresql_concurrently=True)
+        op.drop_index('ix_llm_history_case_id', table_name='llm_history', postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_llm_history_case_id', 'llm_history', ['case_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_images_case_id', 'images', ['case_id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_llm_history_case_id_user_id_start_ts', table_name='llm_history', postgresql_concurrently=True)
+        op.drop_index('ix_llm_history_case_id_start_ts', table_name='llm_history', postgresql_concurrently=True)
+        op.drop_index('ix_images_case_id_user_id_uploaded', table_name='images', postgresql_concurrently=True)
+        op.drop_index('ix_images_case_id_uploaded', table_name='images', postgresql_concurrently=True)
+        op.drop_index('ix_cases_case_id_pattern', table_name='cases', postgresql_concurrently=True)
+        op.drop_index('ix_cases_updated', table_name='cases', postgresql_concurrently=True)
+        op.drop_index('ix_cases_user_id_updated', table_name='cases', postgresql_concurrently=True)
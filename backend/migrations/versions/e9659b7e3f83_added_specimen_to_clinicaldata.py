@@ -18,15 +18,22 @@ branch_labels: Union[str, Sequence[str], None] = None
 depends_on: Union[str, Sequence[str], None] = None
 
 
+def _is_sqlite() -> bool:
+    return op.get_bind().dialect.name == 'sqlite'
+
+
 def upgrade() -> None:
     """Upgrade schema."""
     # ### commands auto generated by Alembic - please adjust! ###
-    op.add_column('clinical_data', sa.Column('specimen', sa.JSON(), nullable=False))
+    # sqlite can't ALTER in a NOT NULL column without a default, rebuild the table instead
+    with op.batch_alter_table('clinical_data', recreate='always' if _is_sqlite() else 'auto') as batch_op:
+        batch_op.add_column(sa.Column('specimen', sa.JSON(), nullable=False))
     # ### end Alembic commands ###
 
 
 def downgrade() -> None:
     """Downgrade schema."""
     # ### commands auto generated by Alembic - please adjust! ###
-    op.drop_column('clinical_data', 'specimen')
+    with op.batch_alter_table('clinical_data') as batch_op:
+        batch_op.drop_column('specimen')
     # ### end Alembic commands ###
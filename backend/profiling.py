@@ -0,0 +1,108 @@
+import os
+import re
+import hmac
+import time
+import asyncio
+import logging
+import cProfile
+from uuid import uuid4
+
+try:
+    import pyinstrument      # sampling profiler, async aware
+except ImportError:          # falls back to cProfile, deterministic and slower
+    pyinstrument = None
+
+log = logging.getLogger(__name__)
+
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")       # unset: the middleware isn't installed at all
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join("storage", "profiles"))
+PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "html")            # pyinstrument output, "html" or "speedscope"
+PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", "0.001"))  # seconds between samples
+
+
+class _Profile:
+    def __init__(self):
+        if pyinstrument is not None:
+            self.ext = "speedscope.json" if PROFILE_FORMAT == "speedscope" else "html"
+            # async_mode follows the request's task and the tasks it awaits, not other requests
+            self._profiler = pyinstrument.Profiler(interval=PROFILE_INTERVAL, async_mode="enabled")
+        else:
+            self.ext = "prof"
+            self._profiler = cProfile.Profile()
+
+    def start(self):
+        if pyinstrument is not None:
+            self._profiler.start()
+        else:
+            self._profiler.enable()
+
+    def stop(self):
+        if pyinstrument is not None:
+            self._profiler.stop()
+        else:
+            self._profiler.disable()
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if pyinstrument is None:
+            self._profiler.dump_stats(path)       # read with pstats or snakeviz
+            return
+        if self.ext == "html":
+            output = self._profiler.output_html()
+        else:
+            from pyinstrument.renderers import SpeedscopeRenderer
+            output = self._profiler.output(SpeedscopeRenderer())
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+class ProfilingMiddleware:
+    """Profiles a single request when it carries `X-Profile: <PROFILE_TOKEN>`.
+
+    The profile is written under PROFILE_DIR once the response has finished and
+    its path is returned in the X-Profile-Path header. One request is profiled
+    at a time, others asking meanwhile get `X-Profile-Skipped: busy`.
+    """
+
+    def __init__(self, app, token: str | None = PROFILE_TOKEN, directory: str = PROFILE_DIR):
+        self.app = app
+        self.token = (token or "").encode()
+        self.directory = directory
+        self._busy = False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        supplied = dict(scope["headers"]).get(b"x-profile")
+        if supplied is None or not self.token or not hmac.compare_digest(supplied, self.token):
+            await self.app(scope, receive, send)
+            return
+        if self._busy:
+            await self.app(scope, receive, _with_header(send, b"x-profile-skipped", b"busy"))
+            return
+
+        profile = _Profile()
+        slug = re.sub(r"[^A-Za-z0-9]+", "-", scope["path"]).strip("-")[:60] or "root"
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{slug}-{uuid4().hex[:8]}.{profile.ext}")
+
+        self._busy = True
+        profile.start()
+        try:
+            await self.app(scope, receive, _with_header(send, b"x-profile-path", path.encode()))
+        finally:
+            profile.stop()
+            self._busy = False
+            try:
+                await asyncio.to_thread(profile.save, path)
+                log.info("Profile for %s %s saved to %s", scope["method"], scope["path"], path)
+            except Exception:
+                log.exception("Could not save profile to %s", path)
+
+
+def _with_header(send, name: bytes, value: bytes):
+    async def send_wrapper(message):
+        if message["type"] == "http.response.start":
+            message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+        await send(message)
+    return send_wrapper
@@ -1,5 +1,6 @@
+from datetime import datetime
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import List, Optional, Literal
 
 class ImagePayload(BaseModel):
     image: str
@@ -9,10 +10,13 @@ class ImagePayload(BaseModel):
 class DeleteImagesPayload(BaseModel):
     filenames: List[str]
     case_id: str
+    return_images: bool = True     # False when the client syncs deltas instead
 
 class GetImagesPayload(BaseModel):
     case_id: str
     user_id: Optional[str] = None
+    limit: Optional[int] = None      # page size, None returns everything
+    cursor: Optional[str] = None     # next_cursor from the previous page
     
 class QueryLLMPayload(BaseModel):
     user_id: str
@@ -31,7 +35,7 @@ class CancelLLMPayload(BaseModel):
 
 class DeleteLLMHistoryPayload(BaseModel):
     case_id: str
-    selected_history: List[int]
+    entry_ids: List[int]        # LLMHistory ids from /llm-history
     user_id: Optional[str] = None
 
 class AppendLLMHistoryPayload(BaseModel):
@@ -42,10 +46,14 @@ class AppendLLMHistoryPayload(BaseModel):
 
 class User(BaseModel):
     user_id: Optional[str] = None
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
 
 class GetLLMHistoryPayload(BaseModel):
     case_id: str
     user_id: Optional[str] = None
+    limit: Optional[int] = None
+    cursor: Optional[str] = None
 
 class AppendLLMHistoryPayload(BaseModel):
     case_id: str
@@ -75,5 +83,129 @@ class ClinicalDocsLLMQuery(BaseModel):
     case_id: str
     user_id: str
     specimen: dict
-    selected: list[str]  
+    selected: list[str]
+    mode: Optional[Literal["single", "map_reduce"]] = None   # map_reduce: per-document calls in parallel, merged per field; None: DOC_LLM_MODE
 
+
+# ─────────────────────────── responses ───────────────────────────
+class StatusResponse(BaseModel):
+    status: str
+    message: Optional[str] = None
+
+class CaptureImageResponse(BaseModel):
+    status: str
+    image_path: str
+
+class ImageItem(BaseModel):
+    id: int
+    filename: str
+    url: str
+
+class ImagesResponse(BaseModel):
+    images: List[ImageItem]
+    count: int
+    next_cursor: Optional[str] = None
+
+class DeleteImagesResponse(BaseModel):
+    # remaining images, or just the status when return_images was False
+    images: Optional[List[ImageItem]] = None
+    count: Optional[int] = None
+    status: Optional[str] = None
+
+class HistoryItem(BaseModel):
+    id: int
+    case_id: str
+    user_id: Optional[str] = None
+    start_ts: datetime
+    end_ts: datetime
+    prompt: str
+    image_count: int
+    response: str
+
+class HistoryResponse(BaseModel):
+    history: List[HistoryItem]
+    next_cursor: Optional[str] = None
+
+class CaseIdResponse(BaseModel):
+    case_id: str
+
+class CasesResponse(BaseModel):
+    cases: List[str]
+    next_cursor: Optional[str] = None
+
+class QueryLLMResponse(BaseModel):
+    response: str
+
+class UserSettingsResponse(BaseModel):
+    settings: dict
+
+class ClinicalFields(BaseModel):
+    specimen: Optional[dict] = None
+    summary: Optional[str] = None
+    procedure: Optional[str] = None
+    pathology: Optional[str] = None
+    imaging: Optional[str] = None
+    labs: Optional[str] = None
+
+class ClinicalResponse(BaseModel):
+    clinical: ClinicalFields
+
+class DocItem(BaseModel):
+    title: str
+    url: str
+
+class DocsResponse(BaseModel):
+    count: int
+    docs: List[DocItem]
+
+class DocUploadResponse(BaseModel):
+    saved: str
+    url: str
+
+class SnapshotCounts(BaseModel):
+    images: int
+    history: int
+    docs: int
+
+class SnapshotCursors(BaseModel):
+    images: Optional[str] = None
+    history: Optional[str] = None
+
+class SnapshotSync(BaseModel):
+    images: int
+    history: int
+
+class CaseSnapshot(BaseModel):
+    case_id: str
+    images: List[ImageItem]
+    history: List[HistoryItem]
+    clinical: ClinicalFields
+    docs: List[DocItem]
+    counts: SnapshotCounts
+    next_cursor: SnapshotCursors
+    sync: SnapshotSync
+
+class ImagesDelta(BaseModel):
+    items: List[ImageItem]
+    removed: List[int]
+    full: bool
+    cursor: int
+
+class HistoryDelta(BaseModel):
+    items: List[HistoryItem]
+    removed: List[int]
+    full: bool
+    cursor: int
+
+class PoolStatus(BaseModel):
+    size: int
+    max_overflow: int
+    checked_out: int
+    checked_in: int
+    overflow: int
+    peak_checked_out: int
+    timeouts: int
+    wait_count: int
+    wait_avg_ms: float
+    wait_p95_ms: float
+    wait_max_ms: float
@@ -0,0 +1,59 @@
+import json
+import asyncio
+import hashlib
+import logging
+import metrics
+
+log = logging.getLogger(__name__)
+
+
+def request_key(*parts) -> str:
+    """Hash of the parts as canonical JSON, equal for requests that would send the same upstream call."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Identical calls in flight at the same time run once, every caller gets that result.
+
+    The call runs in its own task and each caller awaits it through a shield, so
+    cancelling one caller only drops that caller. The call itself is cancelled
+    once nobody is waiting for it anymore. Nothing is kept after it finishes.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._flights: dict[str, _Flight] = {}
+
+    async def do(self, key: str, make_call):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = self._flights[key] = _Flight(asyncio.create_task(make_call()))
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+            metrics.singleflight_calls.inc(self.name, "leader")
+        else:
+            log.info("Joining in-flight %s call %s (%d waiting)", self.name, key[:12], flight.waiters)
+            metrics.singleflight_calls.inc(self.name, "follower")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                # the last caller went away, stop paying for an answer nobody reads
+                self._forget(key, flight)
+                flight.task.cancel()
+
+    def _forget(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    def __len__(self):
+        return len(self._flights)
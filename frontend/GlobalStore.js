@@ -1,6 +1,15 @@
 import { create } from 'zustand';
-import { getLatestCase } from './src/communications/mainServerAPI';
-import {  getUserSettings,  setUserSettings, getLlmHistory, clearLlmHistory, getClinicalData, updateClinicalFields} from './src/communications/mainServerAPI';
+import { getLatestCase, getCaseSnapshot, getCaseItemsDelta } from './src/communications/mainServerAPI';
+import {  getUserSettings,  setUserSettings, clearLlmHistory, getClinicalData, updateClinicalFields} from './src/communications/mainServerAPI';
+
+// apply a delta from getCaseItemsDelta to a list of items with ids
+const mergeDelta = (list, { items, removed, full }) => {
+  if (full) return items;
+  const gone = new Set(removed);
+  const kept = list.filter((item) => !gone.has(item.id));
+  const have = new Set(kept.map((item) => item.id));
+  return [...kept, ...items.filter((item) => !have.has(item.id))];
+};
 
 export const defaultSettings = {
   zoom: 1,
@@ -47,6 +56,11 @@ const useGlobalStore = create((set, get) => ({
 
   llmHistory: [],
   selectedHistory: [],
+  // change cursor of llmHistory and the user filter it was loaded with
+  historySync: { cursor: null, user: null },
+
+  // images of the open case, filled by the snapshot and kept current with deltas
+  caseImages: { images: [], count: 0, cursor: null },
 
   // User inclusion for LLM history and images
   includeUserLLM: false,
@@ -70,8 +84,13 @@ const useGlobalStore = create((set, get) => ({
   // Case management helpers
   setCaseId: (caseId) => {
     set({ caseId });
-    // Reset selected images when case changes
-    set({ selectedImages: [] });
+    // Reset selected images and the previous case's lists / sync cursors when case changes
+    set({
+      selectedImages: [],
+      caseImages: { images: [], count: 0, cursor: null },
+      llmHistory: [],
+      historySync: { cursor: null, user: null },
+    });
   },
 
   fetchLatestCase: async () => {
@@ -128,29 +147,115 @@ const useGlobalStore = create((set, get) => ({
     });
   },
 
+  // Case open: images, history and clinical data in one round trip
+  fetchCaseSnapshot: async () => {
+    const { caseId, user, includeUserLLM } = get();
+    if (!caseId) return;
+    const historyUser = includeUserLLM ? user : null;
+    const snap = await getCaseSnapshot(caseId, { historyUser });
+    if (get().caseId !== caseId) return;   // case changed while loading
+    set((s) => {
+      const clinSettings = { ...s.clinSettings };
+      Object.entries(snap.clinical).forEach(([field, value]) => {
+        clinSettings[field] = { ...clinSettings[field], value };
+      });
+      return {
+        clinSettings,
+        llmHistory: snap.history,
+        historySync: { cursor: snap.sync.history, user: historyUser },
+        caseImages: { images: snap.images, count: snap.counts.images, cursor: snap.sync.images },
+      };
+    });
+  },
+
+  setCaseImages: (images, count) => set({ caseImages: { images, count, cursor: null } }),
+
+  // apply a case event pushed over /ws (see case_events.py)
+  applyCaseEvent: (msg) => {
+    if (msg.case_id !== get().caseId) return;
+    switch (msg.type) {
+      case 'image_added':
+      case 'image_deleted':
+        set((s) => {
+          const images = mergeDelta(s.caseImages.images, {
+            items: msg.image ? [msg.image] : [], removed: msg.ids ?? [],
+          });
+          const gone = new Set(msg.filenames ?? []);
+          return {
+            caseImages: { ...s.caseImages, images, count: images.length },
+            selectedImages: s.selectedImages.filter((f) => !gone.has(f)),
+          };
+        });
+        break;
+      case 'history_appended':
+      case 'history_removed':
+        set((s) => {
+          const removed = msg.ids ?? [];
+          // respect the user filter the history was loaded with
+          const keep = msg.entry && (!s.historySync.user || msg.entry.user_id === s.historySync.user);
+          return {
+            llmHistory: mergeDelta(s.llmHistory, { items: keep ? [msg.entry] : [], removed }),
+            selectedHistory: s.selectedHistory.filter((id) => !removed.includes(id)),
+          };
+        });
+        break;
+      case 'clinical_updated':
+        set((s) => {
+          const clinSettings = { ...s.clinSettings };
+          Object.entries(msg.fields).forEach(([field, value]) => {
+            clinSettings[field] = { ...clinSettings[field], value };
+          });
+          return { clinSettings };
+        });
+        break;
+      default:
+        break;
+    }
+  },
+
+  // fetch only images added / removed since the last sync
+  syncImages: async () => {
+    const { caseId, caseImages } = get();
+    if (!caseId) return;
+    const delta = await getCaseItemsDelta(caseId, 'images', caseImages.cursor);
+    if (!delta || get().caseId !== caseId) return;
+    set((s) => {
+      const images = mergeDelta(s.caseImages.images, delta);
+      return { caseImages: { images, count: images.length, cursor: delta.cursor } };
+    });
+  },
+
   saveSelectedClinical: async (fields) => {
     const { caseId } = get();
     await updateClinicalFields(caseId, fields);
   },
 
   // LLM history management
-  fetchHistory: async (includeUserLLM) => {
-    const { caseId } = get();
+  // delta sync, a full reload only when the user filter changed
+  fetchHistory: async () => {
+    const { caseId, user, includeUserLLM, historySync } = get();
     if (!caseId) return;
-    const { history } = await getLlmHistory(caseId, includeUserLLM);
-    set({ llmHistory: history});
+    const historyUser = includeUserLLM ? user : null;
+    const since = historySync.user === historyUser ? historySync.cursor : null;
+    const delta = await getCaseItemsDelta(caseId, 'history', since, historyUser);
+    if (!delta || get().caseId !== caseId) return;
+    set((s) => ({
+      llmHistory: mergeDelta(s.llmHistory, delta),
+      historySync: { cursor: delta.cursor, user: historyUser },
+    }));
   },
 
-  toggleHistory: (idx) =>
+  // selectedHistory holds history entry ids
+  toggleHistory: (id) =>
     set((s) => {
-      const selected = s.selectedHistory.includes(idx)
-        ? s.selectedHistory.filter((i) => i !== idx)
-        : [...s.selectedHistory, idx];
+      const selected = s.selectedHistory.includes(id)
+        ? s.selectedHistory.filter((i) => i !== id)
+        : [...s.selectedHistory, id];
       return { selectedHistory: selected };
     }),
 
   selectAllHistory: () =>
-    set((s) => ({ selectedHistory: s.llmHistory.map((_, i) => i) })),
+    set((s) => ({ selectedHistory: s.llmHistory.map((item) => item.id) })),
 
   selectNoneHistory: () => set({ selectedHistory: [] }),
 
@@ -158,7 +263,7 @@ const useGlobalStore = create((set, get) => ({
     const { caseId, selectedHistory } = get();
     await clearLlmHistory(caseId, selectedHistory);
     set((s) => ({ 
-      llmHistory: s.llmHistory.filter((_, i) => !s.selectedHistory.includes(i)),
+      llmHistory: s.llmHistory.filter((item) => !s.selectedHistory.includes(item.id)),
       selectedHistory: [] 
     }));
   },
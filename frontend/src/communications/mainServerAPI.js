@@ -25,22 +25,60 @@ async function apiGet(path) {
   return res.json();
 }
 
+/* ---------- case snapshot ---------- */
+// images, history, clinical data and docs for a case in one request
+export const getCaseSnapshot = (caseId, { imagesUser, historyUser } = {}) => {
+  const params = new URLSearchParams();
+  if (imagesUser) params.set('images_user_id', imagesUser);
+  if (historyUser) params.set('history_user_id', historyUser);
+  const query = params.toString();
+  return apiGet(`/cases/${encodeURIComponent(caseId)}/snapshot${query ? `?${query}` : ''}`);
+};
+
+/* ---------- delta sync ---------- */
+// kind = 'images' | 'history'. Returns { items, removed, cursor, full }; pass the last
+// cursor as since, or null for the full list. A delta returns null when nothing changed
+// (304); a full list always comes back, from the copy kept with its ETag on a 304,
+// since the caller may no longer hold it (e.g. after switching the user filter back)
+const etags = new Map();      // path -> { etag, body }, body kept for full lists only
+
+export async function getCaseItemsDelta(caseId, kind, since = null, userId = null) {
+  const isDelta = since !== null && since !== undefined;
+  const params = new URLSearchParams();
+  if (isDelta) params.set('since', since);
+  if (userId) params.set('user_id', userId);
+  const query = params.toString();
+  const path = `/cases/${encodeURIComponent(caseId)}/${kind}${query ? `?${query}` : ''}`;
+
+  const cached = etags.get(path);
+  const headers = cached ? { 'If-None-Match': cached.etag } : {};
+  const res = await fetch(`${API_BASE}${path}`, { headers });
+  if (res.status === 304) return isDelta ? null : cached.body;
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  const body = await res.json();
+  const etag = res.headers.get('ETag');
+  if (etag) etags.set(path, { etag, body: isDelta ? null : body });
+  return body;
+}
+
 /* ---------- image endpoints ---------- */
 export const captureImage = (image, caseId, includeUser = true) =>
     apiPost('/capture-image', { image, case_id: caseId }, includeUser);
 
-export const deleteImages = (filenames, caseId, includeUser = false) =>
-  apiPost('/delete-images', { filenames, case_id: caseId }, includeUser);
+// returnImages = false skips sending back the remaining list, sync with getCaseItemsDelta instead
+export const deleteImages = (filenames, caseId, includeUser = false, returnImages = true) =>
+  apiPost('/delete-images', { filenames, case_id: caseId, return_images: returnImages }, includeUser);
 
-export const getImages = (caseId, includeUser = false) =>
-  apiPost('/get-images', { case_id: caseId }, includeUser);
+// page = { limit, cursor }, omit for the full list; responses carry next_cursor
+export const getImages = (caseId, includeUser = false, page = {}) =>
+  apiPost('/get-images', { case_id: caseId, ...page }, includeUser);
 
 /* ---------- case helpers ---------- */
 export const getLatestCase = (includeUser = false) =>
   apiPost('/get-latest-case', {}, includeUser);
 
-export const listCases = (includeUser = false) =>
-  apiPost('/list-cases', {}, includeUser);
+export const listCases = (includeUser = false, page = {}) =>
+  apiPost('/list-cases', { ...page }, includeUser);
 
 export const createNewCase = (includeUser = false) =>
   apiPost('/create-new-case', {}, includeUser);
@@ -64,12 +102,13 @@ export const setUserSettings = (userId, settings) =>
 export const appendLlmHistory = (caseId, prompt, response, imageCount) =>
   apiPost('/append-llm-history', { case_id: caseId, prompt, response, image_count: imageCount }, true);
 
-export const getLlmHistory = (caseId, includeUser = false) =>
-  apiPost('/llm-history', { case_id: caseId }, includeUser);
+export const getLlmHistory = (caseId, includeUser = false, page = {}) =>
+  apiPost('/llm-history', { case_id: caseId, ...page }, includeUser);
 
-export const clearLlmHistory = (caseId, selected) =>
+// entryIds are history entry ids, not list positions
+export const clearLlmHistory = (caseId, entryIds) =>
   apiPost('/clear-llm-history',
-          { case_id: caseId, selected_history: selected });
+          { case_id: caseId, entry_ids: entryIds });
 
           /* ---------- clinical data ---------- */
 export const getClinicalData = (caseId) =>
@@ -90,9 +129,38 @@ export const deleteClinicalDocs = (caseId, urls) =>
   apiPost('/clinical-docs/delete', { case_id: caseId, urls });
 
 /* ---------- clinical documents llm call ---------- */
-export const processClinicalDocsLlmQuery = (caseId, selected, specimen) =>
+export const processClinicalDocsLlmQuery = (caseId, selected, specimen, mode = 'single') =>
   apiPost('/clinical-docs/llm-query',
-          { case_id: caseId, selected, specimen }, true);
+          { case_id: caseId, selected, specimen, mode }, true);
+
+/* streams ndjson lines, onField(field, value) fires as soon as each field is finished */
+// mode left out: the server's DOC_LLM_MODE decides
+export async function streamClinicalDocsLlmQuery(caseId, selected, specimen, onField, mode) {
+  const { user } = useGlobalStore.getState();
+  const res = await fetch(`${API_BASE}/clinical-docs/llm-query/stream`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify({ case_id: caseId, selected, specimen, mode, user_id: user })
+  });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = '';
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += decoder.decode(value, { stream: true });
+    const lines = buffer.split('\n');
+    buffer = lines.pop();
+    for (const line of lines) {
+      if (!line.trim()) continue;
+      const msg = JSON.parse(line);
+      if (msg.error) throw new Error(msg.error);
+      if (msg.field) onField(msg.field, msg.value);
+    }
+  }
+}
 
 
 
@@ -1,24 +1,48 @@
+
 // very small wrapper ------------------------------------------------
-export function openSignallingSocket(onMessage) {
-    const socket = new WebSocket(import.meta.env.VITE_WS_ORIGIN ?? `wss://${location.hostname}:8000/ws`);
-    console.log('Connecting to signalling server:', socket.url);
+// reconnects with backoff when the socket drops; onConnect(id) runs after every (re)connect
+export function openSignallingSocket(onMessage, onConnect) {
+    const url = import.meta.env.VITE_WS_ORIGIN ?? `wss://${location.hostname}:8000/ws`;
+    let socket = null;
     let myId = null;
-    console.log('Attempting to connect to signalling server:');
-    socket.onmessage = (ev) => {
-      const msg = JSON.parse(ev.data);
-      if (msg.type === 'id') {
-        // console.log("Signalling socket connected:", msg.id);
-        myId = msg.id;               // On first connect, we get our socket-ID
-      } else {
-        // console.log("Signalling msg:", msg);
-        onMessage(msg);              // On subsequent connects, call the handler from Phone or Viewer
-      }
-    };
+    let retryDelay = 500;
+    let retryTimer = null;
+    let closed = false;
+
+    function connect() {
+      socket = new WebSocket(url);
+      console.log('Connecting to signalling server:', socket.url);
+      socket.onmessage = (ev) => {
+        const msg = JSON.parse(ev.data);
+        if (msg.type === 'id') {
+          // console.log("Signalling socket connected:", msg.id);
+          myId = msg.id;             // every connect gets a fresh socket-ID
+          retryDelay = 500;
+          onConnect?.(myId);
+        } else {
+          // console.log("Signalling msg:", msg);
+          onMessage(msg);            // On subsequent messages, call the handler from Phone or Viewer
+        }
+      };
+      socket.onclose = () => {
+        myId = null;
+        if (closed) return;
+        console.warn(`Signalling socket closed, reconnecting in ${retryDelay} ms`);
+        retryTimer = setTimeout(connect, retryDelay);
+        retryDelay = Math.min(retryDelay * 2, 10000);
+      };
+    }
 
     function send(msg) {
       socket.readyState === 1 && socket.send(JSON.stringify(msg));
     }
 
-    return { send, peerId: () => myId };
+    function close() {
+      closed = true;
+      clearTimeout(retryTimer);
+      socket.close();
+    }
+
+    connect();
+    return { send, close, peerId: () => myId };
   }
-  
\ No newline at end of file
@@ -6,7 +6,7 @@ import ClinicalDataModal from './ClinicalDataModal.jsx';
 import HistoryModal from './HistoryModal';
 
 export default function BottomBarContent({bottomBarHeight}) {
-    const { settings, clinSettings, updateSetting, selectedImages, caseId, includeUserLLM, fetchHistory, setClinicalFieldValue } = useGlobalStore();
+    const { settings, clinSettings, updateSetting, selectedImages, caseId, includeUserLLM, setClinicalFieldValue } = useGlobalStore();
     const clinDataWidth = settings.bottomBarClinDataWidth || '30vw';
     const inputTextWidth = settings.bottomBarInputTextWidth || '35vw'; 
     const llmResponseWidth = settings.bottomBarLlmResponseWidth || '35vw';
@@ -120,9 +120,8 @@ export default function BottomBarContent({bottomBarHeight}) {
             clinicalData
         );
         console.log('LLM Response:', response['response']);
-        appendLlmHistory(caseId, currentPrompt, response['response'], selectedImages.length)
         setLlmResponse(response['response']);
-        await fetchHistory();  // Refresh history after appending
+        await appendLlmHistory(caseId, currentPrompt, response['response'], selectedImages.length);  // arrives back as history_appended
     }
 
     const handleUseImagesCheck = (event) => {
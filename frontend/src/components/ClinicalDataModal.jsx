@@ -1,7 +1,7 @@
 import React, { useEffect, useState, useRef, useLayoutEffect } from 'react';
 import useGlobalStore from '../../GlobalStore';
 import {
-  updateClinicalFields,  getClinicalData,  clinicalDocsRetrieve, uploadClinicalDoc, deleteClinicalDocs, processClinicalDocsLlmQuery 
+  updateClinicalFields,  getClinicalData,  clinicalDocsRetrieve, uploadClinicalDoc, deleteClinicalDocs, streamClinicalDocsLlmQuery 
 } from '../communications/mainServerAPI';
 import '../styles/ClinicalDataModal.css';
 import { Rnd } from 'react-rnd';
@@ -95,11 +95,13 @@ export default function ClinicalDataModal({ open, onClose }) {
     setOutputMsg('Please wait for the LLM to process the documents…');
 
     try {
-      const newVals = await processClinicalDocsLlmQuery(caseId, Array.from(selected), clinSettings.specimen.value);
-      Object.entries(newVals).forEach(([k,v]) => {
-        if (k !== 'specimen') {
-          setClinicalFieldValue(k, v);
-        }
+      const received = [];
+      await streamClinicalDocsLlmQuery(caseId, Array.from(selected), clinSettings.specimen.value, (k, v) => {
+        if (k === 'specimen') return;
+        setClinicalFieldValue(k, v);
+        fitTextarea(k);
+        received.push(k);
+        setOutputMsg(`Received: ${received.join(', ')}. Waiting for the remaining fields…`);
       });
       setOutputMsg(
         `Query completed. Selected fields updated: ${Array.from(selected).join(
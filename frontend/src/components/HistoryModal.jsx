@@ -48,14 +48,14 @@ export default function HistoryModal({ open, onClose }) {
 
         <div className="hist-list">
           {llmHistory.length === 0 && <p>No history yet.</p>}
-          {llmHistory.map((item, idx) => (
+          {llmHistory.map((item) => (
 
-            <div key={idx} className="hist-item">
+            <div key={item.id} className="hist-item">
               <label>
                 <input
                   type="checkbox"
-                  checked={selectedHistory.includes(idx)}
-                  onChange={() => toggleHistory(idx)}
+                  checked={selectedHistory.includes(item.id)}
+                  onChange={() => toggleHistory(item.id)}
                 />
                 <span className="hist-ts">
                   {
@@ -1,6 +1,6 @@
 import React, { useState, useEffect, useRef, use } from 'react';
 import '../styles/Sidebar.css';
-import { getImages, deleteImages, listCases, createNewCase, captureImage } from '../communications/mainServerAPI';
+import { deleteImages, listCases, createNewCase, captureImage } from '../communications/mainServerAPI';
 import useGlobalStore from '../../GlobalStore';
 import { Autocomplete, TextField, Box } from '@mui/material';
 import UserSettingsModal from './UserSettingsModal';
@@ -15,12 +15,13 @@ export default function SideBar({ streamRef }) {
         setCaseId,
         selectedImages,
         setSelectedImages,
+        caseImages,
+        setCaseImages,
         settings: { sidebarCollapsed },
         updateSetting,
     } = useGlobalStore();
     const isCollapsed = sidebarCollapsed;
-    const [serverImages, setServerImages] = useState([]);
-    const [imageCount, setImageCount] = useState(0);
+    const { images: serverImages, count: imageCount } = caseImages;
     const [imagesModal, setImagesModal] = useState(false);
     const [lightboxUrl, setLightboxUrl] = useState(null);
     const imagesButtonRef = useRef(null);
@@ -39,9 +40,8 @@ export default function SideBar({ streamRef }) {
     const [showSettings, setShowSettings] = useState(false);
 
     useEffect(() => {
+        // the new image itself arrives as an image_added event on /ws
         const handleImageCaptured = async (event) => {
-            await loadImages();
-            
             // Auto-select the newly captured image if the setting is enabled
             const { settings } = useGlobalStore.getState();
             if (settings.autoSelectCaptured && event.detail?.filename) {   
@@ -54,28 +54,12 @@ export default function SideBar({ streamRef }) {
     }, [caseId]);
 
 
+    // images for a newly opened case arrive with the case snapshot (ViewerLayout)
     useEffect(() => {
-        loadImages();
-        console.log('Loading images for case:', caseId);
+        if (!caseId) setCaseImages([], 0);
     }, [caseId]);
 
 
-    const loadImages = async () => {
-        try {if (caseId) {
-            const response = await getImages(caseId);
-            setServerImages(response.images);
-            setImageCount(response.count);
-        }
-            else {
-                console.log('No case ID set, skipping image load.');
-                setServerImages([]);
-                setImageCount(0);
-            }
-        } catch (error) {
-            console.error('Error fetching images:', error);
-        }
-    };
-
     const handleSelectAll = () => {
 
         setSelectedImages(serverImages.map(img => img.filename));
@@ -87,9 +71,7 @@ export default function SideBar({ streamRef }) {
 
     const handleDeleteSelected = async () => {
         try {
-            const { images: updated, count } = await deleteImages(selectedImages, caseId);
-            setServerImages(updated);
-            setImageCount(count);
+            await deleteImages(selectedImages, caseId, false, false);   // image_deleted event updates the list
             setSelectedImages([]);
         } catch (error) {
             console.error('Error deleting images:', error);
@@ -165,7 +147,6 @@ export default function SideBar({ streamRef }) {
             setIsUploading(false);
             // event.current.value = ''; // Reset the input value
             uploadInputRef.current.value = ''; // Reset the input value
-            loadImages(); // Reload images after upload
         }
     };
 
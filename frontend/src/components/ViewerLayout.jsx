@@ -8,7 +8,7 @@ import '../styles/Viewer.css';
 export default function ViewerLayout({ videoStream, videoControls, streamRef }) {
     const [isResizingBottomBar, setIsResizingBottomBar] = useState(false);
     const [mouseStartY, setMouseStartY] = useState(0);
-    const { settings, updateSetting, fetchUserSettings, fetchLatestCase, fetchClinicalData, caseId, user } = useGlobalStore();
+    const { settings, updateSetting, fetchUserSettings, fetchLatestCase, fetchCaseSnapshot, caseId, user } = useGlobalStore();
     const bottomBarHeight = settings.bottomBarHeight || 250; // Default height if not set
 
     // Fetch user settings once on mount
@@ -24,12 +24,12 @@ export default function ViewerLayout({ videoStream, videoControls, streamRef })
         fetchLatestCase();
     }, []);
 
-    // Fetch clinical data once on mount
+    // Load everything for the case (images, history, clinical data, docs) when it opens
     useEffect(() => {
         if (caseId) {
-            console.log('Fetching clinical data on mount for caseId:', caseId);
-            fetchClinicalData().catch((error) => {
-                console.error('Error fetching clinical data:', error);
+            console.log('Fetching case snapshot for caseId:', caseId);
+            fetchCaseSnapshot().catch((error) => {
+                console.error('Error fetching case snapshot:', error);
             });
         }
     }, [caseId]);
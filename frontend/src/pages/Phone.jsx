@@ -79,6 +79,7 @@ export default function Phone() {
       mounted = false;
       peerRef.current?.destroy();
       sockRef.current?.send({ type: "hangup" });
+      sockRef.current?.close();
       sockRef.current = null;
     };
   }, []);
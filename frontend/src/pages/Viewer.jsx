@@ -3,31 +3,56 @@ import Peer from 'simple-peer/simplepeer.min.js';
 import { openSignallingSocket } from '../communications/signalling';
 import VideoControls from '../components/VideoControls';
 import ViewerLayout from '../components/ViewerLayout';
+import useGlobalStore from '../../GlobalStore';
 // import SideBar from '../components/SideBar';
 
+const CASE_EVENTS = new Set(['image_added', 'image_deleted', 'history_appended', 'history_removed', 'clinical_updated']);
+
 export default function Viewer() {
     const videoRef = useRef(null);
     const peerRef = useRef(null);
     const sockRef = useRef(null);
     const [status, setStatus] = useState('waiting for phone…');
+    const caseId = useGlobalStore((s) => s.caseId);
+
+    const caseIdRef = useRef(caseId);
 
     useEffect(() => {
-        sockRef.current = openSignallingSocket(handleSignal);
-        const wait = setInterval(() => {
-            const me = sockRef.current.peerId();
-            if (!me) return;
-            clearInterval(wait);
+        // runs again after every reconnect: announce the new socket-ID and follow the open case again
+        sockRef.current = openSignallingSocket(handleSignal, (me) => {
             sockRef.current.send({ type: 'ready', from: me });
-        }, 50);
+            subscribe(caseIdRef.current);
+        });
 
         return () => {
             peerRef.current?.destroy();
             sockRef.current?.send({ type: 'hangup' });
+            sockRef.current?.close();
             sockRef.current = null;
         };
     }, []);
 
+    // follow the open case: the server pushes image / history / clinical changes for it
+    useEffect(() => {
+        caseIdRef.current = caseId;
+        if (sockRef.current?.peerId()) subscribe(caseId);
+    }, [caseId]);
+
+    // events sent while we were not subscribed are gone, a delta sync picks up what was missed.
+    // only from an existing cursor: right after a case switch the snapshot is still loading the lists
+    function subscribe(id) {
+        if (!id) return;
+        sockRef.current.send({ type: 'subscribe', case_id: id });
+        const { caseImages, historySync, syncImages, fetchHistory } = useGlobalStore.getState();
+        if (caseImages.cursor != null) syncImages().catch(console.error);
+        if (historySync.cursor != null) fetchHistory().catch(console.error);
+    }
+
     function handleSignal(msg) {
+        if (CASE_EVENTS.has(msg.type)) {
+            useGlobalStore.getState().applyCaseEvent(msg);
+            return;
+        }
         if (msg.type === 'offer') {
             const meId = sockRef.current.peerId();
             peerRef.current = new Peer({